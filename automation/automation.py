@@ -72,12 +72,24 @@ def save_cut_scene():
         config.save(paths.audio_config, config.audio_config())
 
 
+def assemble_rough_audio():
+    paths = lecture_edit.Paths(bpy.data.filepath)
+    config = lecture_edit.Config(paths)
+    lecture_edit.assemble_rough_audio(paths, config)
+
+
 def normalize_audio():
     paths = lecture_edit.Paths(bpy.data.filepath)
     config = lecture_edit.Config(paths)
     lecture_edit.normalize_audio(paths, config)
 
 
+def ensure_waveforms():
+    paths = lecture_edit.Paths(bpy.data.filepath)
+    config = lecture_edit.Config(paths)
+    lecture_edit.ensure_waveforms(paths, config)
+
+
 def save_slides_scene():
     paths = lecture_edit.Paths(bpy.data.filepath)
     config = lecture_edit.Config(paths)
@@ -19,19 +19,31 @@ width = 1920    # the width in number of pixels of the target video
 height = 1080   # the height in number of pixels of the target video
 
 # audio normalization settings
-audio_channel = 1               # the channel of the rough audio file, that shall be used as the speaker audio track
+rough_audio_crossfade = 0.01    # the length in seconds of the crossfades at the cuts, when the rough audio track is assembled without Blender
+audio_channel = 1               # the channel of the rough audio file, that shall be used as the speaker audio track (a list of channels or "all" keeps multiple channels)
+link_channels = True            # whether the same gain shall be applied to all channels, when multiple channels are normalized
 highpass_frequencies = [100.0]  # frequencies of high pass filters in Hz below which the frequencies are attenuated. Specify multiple frequencies for a sharper roll-off
 notch_filter_frequencies = []   # frequencies for notch filters, that attenuate specific frequencies. Can be used to attenuate hum. Consider specifying a filter for the base frequency of the hum (e.g. 50Hz) and its low integer multiples, especially the odd ones (e.g. 150Hz and 250Hz)
 notch_filter_q_factor = 10      # the Q-factor for the filter. Higher values result in a greater attenuation of a narrower frequency band
+fft_notch_filter = False        # whether all notch filter frequencies shall be attenuated with a single FFT based filter, whose processing time does not grow with the number of frequencies
 target_level = -20.0            # the target level of the normalization in dB[FS]
 headroom = -0.1                 # the maximum level of the limiter in db[FS]
-audio_resolution = 16           # the resolution of the resulting audio file in bits per sample
+audio_resolution = 16           # the resolution of the resulting audio file in bits per sample (16, 24 or 32)
+audio_dither = False            # whether triangular dither shall be added before reducing the resolution of the resulting audio file
 level_smoothing = 10.0          # the smoothing time in seconds for the normalization
 level_threshold = -10.0         # a threshold in dB of the current level, below which a part is regarded as silent and ignored in the normalization
 limiter_lookahead = 0.025       # the lookahead time in seconds of the limiter
+level_decimation = 1            # the factor by which the sampling rate of the level computation is reduced. A factor of 48 speeds up the level computation tenfold with a level error below 0.02dB
+audio_workers = 1               # the number of processes for the audio normalization. With more than one, segments of the audio are processed in parallel
+audio_precision = "float64"     # the precision of the audio processing ("float64" or "float32"). Single precision is faster and needs less memory, but changes a few samples by one least significant bit
+audio_resampling = False        # whether the normalized audio shall be resampled to the sampling_rate below, so Blender does not have to resample it during playback and rendering
+audio_profile = False           # whether the time (and if set to "memory" also the peak memory) of the audio processing stages shall be saved to Intermediate/audio_profile.json
+audio_checkpoint_interval = 60  # the time in seconds between the checkpoints, from which an interrupted audio normalization is resumed (None disables the checkpoints)
 
 # settings for the export of the slide transitions to PowerPoint
 fps_correction = (25 / fps) * (85918 / 70845) * (70832 / 70845)  # a correction factor for the slide transition times, so the video rendered by PowerPoint can be treated as if it had the desired frame rate
+presentation_compression_level = 9  # the compression level (0-9) of the slides, that are changed for the export. The other files of the presentation are copied without compressing them again
+presentation_workers = 1            # the number of processes, that change the slides for the export in parallel, while the other files of the presentation are copied
 
 # settings for compensating distortions in the green screen video
 # (as specified in the corner pin and lens distortion nodes in the Greenscreen scenes' compositing view)
@@ -15,7 +15,13 @@
 from .config import *
 from .external import *
 from .paths import *
-from .scenes import *
+
+try:
+    import bpy
+except ImportError:  # outside of Blender, only the modules, that do not depend on it, can be used (e.g. lecture_edit.batch)
+    pass
+else:
+    from .scenes import *
 
 def reload():
     import importlib
@@ -0,0 +1,108 @@
+# Copyright 2020-2021 Jonas Schulte-Coerne and the CYSTINET-Africa project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Normalizes the audio of many lecture projects without Blender. Run it from the automation directory with
+#     python -m lecture_edit.batch <directories with lecture projects>
+
+import multiprocessing
+import os
+import time
+import traceback
+from . import normalization
+from .config import Config
+from .external import assemble_rough_audio, normalize_audio
+from .paths import Paths
+
+__all__ = ("find_projects", "needs_normalization", "normalize_projects")
+
+
+def find_projects(directories):
+    # a lecture project is identified by its .blend file (Blender's backup files end with .blend1, .blend2...)
+    projects = []
+    for directory in directories:
+        for path, subdirectories, files in os.walk(directory):
+            subdirectories[:] = sorted(d for d in subdirectories if not d.startswith(".") and d not in ("Raw", "Source", "Intermediate", "Final"))
+            projects.extend(os.path.join(path, f) for f in sorted(files) if f.endswith(".blend"))
+    return projects
+
+
+def needs_normalization(paths):
+    # the audio has to be normalized, if the normalized audio file is older than the rough audio or its config
+    if not os.path.isfile(paths.lecture_audio.os):
+        return True
+    sources = [p for p in (paths.rough_audio, paths.audio_config) if os.path.isfile(p.os)]
+    return any(paths.lecture_audio.mtime() <= p.mtime() for p in sources)
+
+
+def normalize_projects(directories, jobs=None, force=False):
+    projects = []
+    skipped = []
+    for project_file in find_projects(directories):
+        paths = Paths(project_file)
+        if not os.path.isfile(paths.rough_audio.os) and not os.path.isfile(paths.cut_config.os):
+            skipped.append((project_file, "no rough audio"))
+        elif force or needs_normalization(paths):
+            projects.append(project_file)
+        else:
+            skipped.append((project_file, "up to date"))
+    for project_file, reason in skipped:
+        print(f"skipped ({reason}): {project_file}")
+    jobs = max(1, min(jobs or os.cpu_count(), len(projects)))
+    start = time.time()
+    results = []
+    # the projects are processed in parallel, so each project is normalized in a single process, because
+    # the worker processes of the pool cannot start processes themselves
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap_unordered(_normalize_project, projects):
+            project_file, audio_duration, duration, error = result
+            if error is None:
+                print(f"normalized {audio_duration / 60:.1f} minutes in {duration:.1f}s: {project_file}")
+            else:
+                print(f"failed: {project_file}\n{error}")
+            results.append(result)
+    duration = time.time() - start
+    audio_duration = sum(r[1] for r in results if r[3] is None)
+    failed = sum(1 for r in results if r[3] is not None)
+    print(f"normalized {len(results) - failed} projects, skipped {len(skipped)}, failed {failed}")
+    if results:
+        print(f"processed {audio_duration / 3600:.2f} hours of audio in {duration / 60:.1f} minutes "
+              f"({audio_duration / duration:.1f}x real time with {jobs} processes)")
+    return results
+
+
+def _normalize_project(project_file):
+    start = time.time()
+    try:
+        paths = Paths(project_file)
+        config = Config(paths)
+        # projects, that have been cut, but whose rough audio has not been exported, are assembled without Blender
+        if not os.path.isfile(paths.rough_audio.os):
+            assemble_rough_audio(paths, config)
+        _, sampling_rate, length = normalization.read(paths.rough_audio.os, channel=config.audio_config()["channel"])
+        normalize_audio(paths, config, workers=1)
+    except Exception:
+        return project_file, 0.0, time.time() - start, traceback.format_exc()
+    return project_file, length / sampling_rate, time.time() - start, None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Normalizes the audio of all lecture projects in the given directories.")
+    parser.add_argument("directories", help="directories, that are searched for lecture projects (.blend files)", nargs="+")
+    parser.add_argument("-j", "--jobs", help="the number of projects, that are processed in parallel (default: the number of processor cores)", type=int, default=None)
+    parser.add_argument("-f", "--force", help="also normalize the projects, whose normalized audio is up to date", action="store_true")
+    args = parser.parse_args()
+
+    normalize_projects(args.directories, jobs=args.jobs, force=args.force)
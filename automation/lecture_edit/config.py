@@ -144,30 +144,37 @@ class Config:
         # get the default values for all values, that are not specified in the config file
         defaults = self.defaults()
         config.setdefault("channel", defaults.audio_channel)
+        config.setdefault("link_channels", defaults.link_channels)
         config.setdefault("highpass_frequencies", defaults.highpass_frequencies)
         config.setdefault("notch_filter_frequencies", defaults.notch_filter_frequencies)
         config.setdefault("notch_filter_q_factor", defaults.notch_filter_q_factor)
+        config.setdefault("fft_notch_filter", defaults.fft_notch_filter)
         config.setdefault("target_level", defaults.target_level)
         config.setdefault("headroom", defaults.headroom)
         config.setdefault("resolution", defaults.audio_resolution)
+        config.setdefault("dither", defaults.audio_dither)
         config.setdefault("level_smoothing", defaults.level_smoothing)
         config.setdefault("level_threshold", defaults.level_threshold)
         config.setdefault("limiter_lookahead", defaults.limiter_lookahead)
+        config.setdefault("level_decimation", defaults.level_decimation)
+        config.setdefault("workers", defaults.audio_workers)
+        config.setdefault("precision", defaults.audio_precision)
+        config.setdefault("resampling", defaults.audio_resampling)
+        config.setdefault("profile", defaults.audio_profile)
+        config.setdefault("checkpoint_interval", defaults.audio_checkpoint_interval)
         return config
 
     def slide_transitions(self):
         return sorted(self.__config_get(self.__paths.slide_transitions, None, default=[]))
 
+    def presentation_index(self):
+        return pptx.PresentationIndex(self.__paths.presentation, self.__paths.presentation_index)
+
     def slide_titles(self):
         if os.path.isfile(self.__paths.presentation.os):
-            for slide_xml in pptx.slide_xmls(self.__paths.presentation):
-                body = pptx.xml_find(slide_xml, ["p:cSld", "p:spTree", "p:sp", "p:txBody"])
-                if body:
-                    node = pptx.xml_find(body, ["a:p"])
-                    yield "".join(n.text for n in pptx.xml_walk(node) if n.text is not None)
-                else:
-                    yield "<picture slide>"
-                for i, _ in enumerate(pptx.slide_animations(slide_xml), start=1):
+            for slide in self.presentation_index().slides:
+                yield "<picture slide>" if slide.title is None else slide.title
+                for i in range(1, slide.animations + 1):
                     yield f"Animation {i}"
 
     def slide_durations(self, scene, powerpoint=False):
@@ -178,10 +185,10 @@ class Config:
             last_frame = scene.frame_end
             frame = 0
             transitions = iter(self.slide_transitions())
-            for slide_xml in pptx.slide_xmls(self.__paths.presentation):
+            for slide in self.presentation_index().slides:
                 start = frame
                 animations = []
-                for _ in pptx.slide_animations(slide_xml):
+                for _ in range(slide.animations):
                     try:
                         t = next(transitions)
                     except StopIteration:
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import os
 import subprocess
 from . import normalization
 from . import pptx
+from . import rough_audio
+from . import waveform
 
-__all__ = ("convert_slides_videos", "normalize_audio", "create_presentation", "initialize_speaker_visibility")
+__all__ = ("convert_slides_videos", "assemble_rough_audio", "normalize_audio", "ensure_waveforms", "create_presentation", "initialize_speaker_visibility")
 
 
 def convert_slides_videos(paths, config):
@@ -36,7 +39,18 @@ def convert_slides_videos(paths, config):
         output = subprocess.check_output(command)
 
 
-def normalize_audio(paths, config):
+def assemble_rough_audio(paths, config):
+    defaults = config.defaults()
+    cuts = config.cuts("cut.speaker_audio" if paths.speaker_audio is not None else "cut.speaker_video")
+    rough_audio.assemble(
+        cuts={p.os: cuts[p] for p in sorted(cuts)},
+        target=paths.rough_audio.os,
+        fps=defaults.fps,
+        crossfade=defaults.rough_audio_crossfade,
+    )
+
+
+def normalize_audio(paths, config, workers=None):
     settings = config.audio_config()
     normalization.normalize(
         source=paths.rough_audio.os,
@@ -45,21 +59,44 @@ def normalize_audio(paths, config):
         highpass_frequencies=settings["highpass_frequencies"],
         notch_filter_frequencies=settings["notch_filter_frequencies"],
         notch_filter_q_factor=settings["notch_filter_q_factor"],
+        fft_notch_filter=settings["fft_notch_filter"],
         target_level=settings["target_level"],
         headroom=settings["headroom"],
         resolution=settings["resolution"],
         level_smoothing=settings["level_smoothing"],
         level_threshold=settings["level_threshold"],
         limiter_lookahead=settings["limiter_lookahead"],
-        show_progress=False
+        show_progress=False,
+        workers=settings["workers"] if workers is None else workers,
+        level_decimation=settings["level_decimation"],
+        dither=settings["dither"],
+        level_cache=paths.level_cache.os,
+        link_channels=settings["link_channels"],
+        target_sampling_rate=config.defaults().sampling_rate if settings["resampling"] else None,
+        dtype=settings["precision"],
+        profile_path=paths.audio_profile.os if settings["profile"] else None,
+        profile_memory=settings["profile"] == "memory",
+        checkpoint_interval=settings["checkpoint_interval"],
     )
 
 
+def ensure_waveforms(paths, config):
+    sources = ([] if paths.speaker_audio is None else [paths.speaker_audio]) + paths.speaker_videos + paths.slides_videos
+    sources += [p for p in (paths.rough_audio, paths.lecture_audio) if os.path.isfile(p.os)]
+    for path in sources:
+        try:
+            waveform.ensure(path.os, paths.waveform_cache(path).os)
+        except ValueError as e:  # e.g. a slides video without an audio stream
+            logging.warning(f"skipping the waveform of {path}: {e}")
+
+
 def create_presentation(scene, paths, config):
     pptx.create_presentation(
         source_file=paths.presentation,
         target_file=paths.lecture_presentation,
         durations=config.slide_durations(scene, powerpoint=True),
+        compression_level=config.defaults().presentation_compression_level,
+        workers=config.defaults().presentation_workers,
     )
 
 
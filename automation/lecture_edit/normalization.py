@@ -12,101 +12,941 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import functools
 import itertools
+import json
 import math
+import multiprocessing
 import os
+import pickle
+import shutil
 import struct
+import subprocess
+import tempfile
 import threading
 import time
-import wave
+import tracemalloc
 import numpy
+try:
+    from .paths import file_info
+except ImportError:  # the module is run as a script with python normalization.py
+    from paths import file_info
 
 __all__ = ("normalize",)
 
 
-def normalize(source, target, channel, highpass_frequencies, notch_filter_frequencies, notch_filter_q_factor, target_level, headroom, resolution, level_smoothing, level_threshold, limiter_lookahead, show_progress):
-    stream, sampling_rate, length = read(path=source, channel=channel)
-    for frequency in highpass_frequencies:
-        stream = highpass(stream, sampling_rate, frequency=frequency, order=2, regularization=0.0001)
-    for frequency in notch_filter_frequencies:
-        stream = notch_filter(stream, sampling_rate, frequency, q_factor=notch_filter_q_factor, regularization=0.0001)
-    stream = a_weighting(stream, sampling_rate)
-    stream = activity(stream, sampling_rate, smoothing_time=0.03)
-    stream = level(stream, sampling_rate, smoothing_time=level_smoothing, threshold=level_threshold)
-    stream = normalization(stream, level=target_level)
-    stream = limiter(stream, sampling_rate, clip=headroom, lookahead=limiter_lookahead, hold=limiter_lookahead / 2)
+def normalize(source, target, channel, highpass_frequencies, notch_filter_frequencies, notch_filter_q_factor, target_level, headroom, resolution, level_smoothing, level_threshold, limiter_lookahead, show_progress, block_size=2**16, workers=1, level_decimation=1, dither=False, level_cache=None, link_channels=True, target_sampling_rate=None, dtype=numpy.float64, fft_notch_filter=False, profile=False, profile_path=None, profile_memory=False, checkpoint_interval=None, follow=None):
+    # with follow, the source is normalized while it is still being written (e.g. by a recorder), until it
+    # has not grown for the given number of seconds (see read())
+    if follow is not None and (workers > 1 or level_cache is not None or checkpoint_interval is not None):
+        raise ValueError("Following a growing source file is not supported together with parallel processing, the level cache or checkpoints.")
+    profiler = _Profiler(memory=profile_memory) if profile or profile_path or profile_memory else None
+    settings = {
+        "highpass_frequencies": highpass_frequencies,
+        "notch_filter_frequencies": notch_filter_frequencies,
+        "notch_filter_q_factor": notch_filter_q_factor,
+        "target_level": target_level,
+        "headroom": headroom,
+        "level_smoothing": level_smoothing,
+        "level_threshold": level_threshold,
+        "limiter_lookahead": limiter_lookahead,
+        "level_decimation": level_decimation,
+        "link_channels": link_channels,
+        "fft_notch_filter": fft_notch_filter,
+    }
+    reuse_levels = False
+    if level_cache is not None:
+        _, sampling_rate, length = read(path=source, channel=channel, sampling_rate=target_sampling_rate)
+        cache_metadata = _level_cache_metadata(level_cache, source, channel, settings, dtype, sampling_rate)
+        reuse_levels = _load_json(_level_cache_metadata_path(level_cache)) == cache_metadata
+    checkpoint = states = None
+    if checkpoint_interval is not None:
+        if not all(str(p).lower().endswith(".wav") for p in (target if isinstance(target, (list, tuple)) else [target])):
+            raise ValueError("Checkpoints are only supported, when the normalized audio is written to wav files.")
+        checkpoint = _Checkpoint(target, _checkpoint_metadata(source, target, channel, settings, resolution, block_size, workers, dither, level_cache, reuse_levels, target_sampling_rate, dtype), checkpoint_interval)
+    if level_cache is not None and not reuse_levels:
+        if os.path.isfile(_level_cache_metadata_path(level_cache)):
+            os.remove(_level_cache_metadata_path(level_cache))
+        # a resumed run continues to fill the cache, that the interrupted run has created
+        if checkpoint is None or not checkpoint.resumed or not os.path.isfile(level_cache):
+            shape = (-(-length // level_decimation),)
+            if not isinstance(channel, int) and not link_channels:
+                shape += (len(_channel_columns(channel, channel_count(source))),)
+            numpy.lib.format.open_memmap(level_cache, mode="w+", dtype=numpy.float32, shape=shape)
+    if workers > 1:
+        segments = None
+        if checkpoint is not None:
+            segments = checkpoint.segments
+            checkpoint.save(frames=0, random=None)
+        stream, sampling_rate, length = _parallel_process(source, channel, block_size, workers, settings, level_cache, reuse_levels, dtype, target_sampling_rate, segments)
+        stream = _profile(stream, "parallel processing", profiler)
+        checkpoint = None  # the segments are the checkpoints, so the writing always starts at the beginning
+    else:
+        start = 0
+        if checkpoint is not None:
+            states = checkpoint.states
+            start = states.setdefault("read", {}).setdefault("position", 0)
+        stream, sampling_rate, length = read(path=source, channel=channel, block_size=block_size, start=start, dtype=dtype, follow=follow, sampling_rate=target_sampling_rate)
+        if length is not None:
+            length += start
+        if states is not None:
+            stream = _read_position(stream, states["read"])
+        stream = _profile(stream, "read", profiler)
+        levels = store = None
+        if level_cache is not None:
+            cache = numpy.load(level_cache, mmap_mode="r" if reuse_levels else "r+")
+            levels, store = (cache, None) if reuse_levels else (None, cache)
+        stream = _process(stream, sampling_rate, levels=levels, store=store, profiler=profiler, states=states, **settings)
+    if target_sampling_rate is not None and int(round(target_sampling_rate)) != int(round(sampling_rate)):
+        stream = resample(stream, sampling_rate, target_sampling_rate, state=None if states is None else states.setdefault("resampling", {}))
+        stream = _profile(stream, "resampling", profiler)
+        if length is not None:
+            length = -(-length * int(round(target_sampling_rate)) // int(round(sampling_rate)))
+        sampling_rate = target_sampling_rate
     if show_progress:
-        stream = status(stream, length=length)
-    write(stream, sampling_rate, path=target, bits=resolution)
+        stream = status(stream, length=None if length is None else length - (0 if checkpoint is None else checkpoint.frames))
+    if profiler is not None:
+        stream = profiler.consumer(stream, "write")
+    frames = write(stream, sampling_rate, path=target, bits=resolution, dither=dither, checkpoint=checkpoint, follow=follow is not None)
+    if length is None:
+        length = frames
+    if level_cache is not None and not reuse_levels:
+        _save_json(_level_cache_metadata_path(level_cache), cache_metadata)
+    if checkpoint_interval is not None:
+        _Checkpoint.remove(target)
+    if profiler is not None:
+        report = profiler.report(source=source, sampling_rate=sampling_rate, length=length, workers=workers)
+        if profile_path is not None:
+            _save_json(profile_path, report)
+        return report
+
+
+def _process(stream, sampling_rate, highpass_frequencies, notch_filter_frequencies, notch_filter_q_factor, target_level, headroom, level_smoothing, level_threshold, limiter_lookahead, level_decimation, link_channels, fft_notch_filter, levels=None, store=None, store_offset=0, profiler=None, states=None):
+    # levels can be an array with previously computed values of the level (with the decimated sampling
+    # rate), which are used instead of computing the level. Otherwise, the computed values are written to
+    # the store array, if it is given, starting with the value at the index store_offset. If a dictionary
+    # is given as states, the stages keep their states in it (and resume from the states, that it contains).
+    state = (lambda name: states.setdefault(name, {})) if states is not None else (lambda name: None)
+    for i, frequency in enumerate(highpass_frequencies):
+        stream = highpass(stream, sampling_rate, frequency=frequency, order=2, regularization=0.0001, state=state(f"highpass{i}"))
+        stream = _profile(stream, f"highpass {frequency:g}Hz", profiler)
+    if fft_notch_filter:
+        if len(notch_filter_frequencies):
+            stream = notch_filter_bank(stream, sampling_rate, notch_filter_frequencies, q_factor=notch_filter_q_factor, state=state("notch filter bank"))
+            stream = _profile(stream, "notch filter bank", profiler)
+    else:
+        for i, frequency in enumerate(notch_filter_frequencies):
+            stream = notch_filter(stream, sampling_rate, frequency, q_factor=notch_filter_q_factor, regularization=0.0001, state=state(f"notch filter{i}"))
+            stream = _profile(stream, f"notch filter {frequency:g}Hz", profiler)
+    if levels is None:
+        stream = _profile(a_weighting(stream, sampling_rate, state=state("A-weighting")), "A-weighting", profiler)
+        if link_channels:
+            stream = combine_channels(stream)
+        if level_decimation > 1:
+            stream = _profile(decimate(stream, factor=level_decimation, state=state("decimation")), "decimation", profiler)
+        stream = activity(stream, sampling_rate / level_decimation, smoothing_time=0.03, state=state("activity"))
+        stream = _profile(stream, "activity", profiler)
+        stream = level(stream, sampling_rate / level_decimation, smoothing_time=level_smoothing, threshold=level_threshold, state=state("level"))
+        if store is not None:
+            stream = _store_levels(stream, store, offset=store_offset, state=state("level store"))
+        stream = _profile(stream, "level", profiler)
+    else:
+        stream = _profile(_attach_levels(stream, levels, factor=level_decimation, state=state("cached level")), "cached level", profiler)
+    if level_decimation > 1:
+        stream = _profile(interpolate(stream, factor=level_decimation, state=state("interpolation")), "interpolation", profiler)
+    stream = _profile(normalization(stream, level=target_level), "normalization", profiler)
+    stream = limiter(stream, sampling_rate, clip=headroom, lookahead=limiter_lookahead, hold=limiter_lookahead / 2, link=link_channels, state=state("limiter"))
+    stream = _profile(stream, "limiter", profiler)
+    return stream
+
+
+###################################
+# Parallel processing of segments #
+###################################
+# The audio file is split into one segment per worker process. Each segment is processed together with a
+# part of the audio before it (pre-roll), in which the states of the filters and envelope followers settle,
+# and a part after it (post-roll), which the limiter needs for looking ahead. These parts are discarded from
+# the result. The pre-roll is six times the level smoothing time, because the level computation only
+# adapts during active speech. With this, the level at the seams deviates by a few thousandths of a dB
+# from that of the serial processing. The workers write their results block by block to temporary files,
+# from which they are streamed to the target file, so that the memory consumption does not depend on the
+# file length.
+# With checkpoints, these files are saved in a directory next to the target file, so that the segments,
+# which have been processed before an interruption, are not processed again.
+
+
+def _parallel_process(source, channel, block_size, workers, settings, level_cache, reuse_levels, dtype, target_sampling_rate=None, directory=None):
+    _, sampling_rate, length = read(path=source, channel=channel, sampling_rate=target_sampling_rate)
+    # the segments and pre-rolls are multiples of the level decimation, so they align with the level values
+    decimation = settings["level_decimation"]
+    preroll = int(round((6 * settings["level_smoothing"] + 2 * settings["limiter_lookahead"]) * sampling_rate))
+    preroll = -(-preroll // decimation) * decimation
+    postroll = 2 * int(round(settings["limiter_lookahead"] * sampling_rate)) + 1
+    segment_length = max(-(-length // workers), 2 * preroll, 1)
+    segment_length = -(-segment_length // decimation) * decimation
+
+    def stream(directory, keep):
+        segments = [
+            (source, channel, block_size, settings, start, min(start + segment_length, length), preroll, postroll,
+             level_cache, reuse_levels, dtype, target_sampling_rate, os.path.join(directory, f"segment{i}.npy"))
+            for i, start in enumerate(range(0, length, segment_length))
+        ]
+        with multiprocessing.Pool(min(workers, len(segments))) as pool:
+            for path in pool.imap(_process_segment, segments):
+                result = numpy.load(path, mmap_mode="r")
+                for i in range(0, len(result), block_size):
+                    yield numpy.array(result[i:i+block_size])
+                del result
+                if not keep:
+                    os.remove(path)
+
+    def temporary_stream():
+        with tempfile.TemporaryDirectory() as directory:
+            yield from stream(directory, keep=False)
+
+    if directory is None:
+        return temporary_stream(), sampling_rate, length
+    os.makedirs(directory, exist_ok=True)
+    return stream(directory, keep=True), sampling_rate, length
+
+
+
+def _process_segment(arguments):
+    source, channel, block_size, settings, start, stop, preroll, postroll, level_cache, reuse_levels, dtype, target_sampling_rate, path = arguments
+    if os.path.isfile(path):
+        return path  # the segment has been processed before the run has been interrupted
+    read_start = max(0, start - preroll)
+    stream, sampling_rate, length = read(path=source, channel=channel, block_size=block_size, start=read_start, stop=stop + postroll, dtype=dtype, sampling_rate=target_sampling_rate)
+    levels = store = None
+    decimation = settings["level_decimation"]
+    if level_cache is not None:
+        cache = numpy.load(level_cache, mmap_mode="r" if reuse_levels else "r+")
+        if reuse_levels:
+            levels = cache[read_start//decimation:]
+        else:
+            store = cache[start//decimation:-(-stop // decimation)]
+    # the blocks are written to the file, as they are computed, and the pre-roll and the post-roll are
+    # discarded on the way, so the segment is never held in memory as a whole
+    offset = start - read_start
+    result = None
+    position = 0  # the position of the current block in the processed audio including the pre-roll
+    for block in _process(stream, sampling_rate, levels=levels, store=store, store_offset=offset // decimation, **settings):
+        first, last = max(offset - position, 0), min(stop - read_start - position, len(block))
+        if first < last:
+            if result is None:
+                result = numpy.lib.format.open_memmap(path + ".part", mode="w+", dtype=block.dtype, shape=(stop - start,) + block.shape[1:])
+            result[position+first-offset:position+last-offset] = block[first:last]
+        position += len(block)
+    result.flush()
+    del result
+    # the file is renamed after it has been written completely, so that an interruption does not leave an incomplete segment
+    os.replace(path + ".part", path)
+    return path
+
+
+#############
+# Profiling #
+#############
+# The profiler measures the wall time and the peak memory consumption of the processing stages. Since the
+# stages are chained generators, the time, that is spent in fetching a block from a stage, includes the
+# time of all stages before it. The time of a stage itself is therefore computed as the difference to the
+# time of the previous stage. The peak memory is the maximum of the memory, that has been allocated by
+# Python and numpy, while the stage computed a block. It is measured with the tracemalloc module, which
+# slows down the stages with loops in Python considerably, so it is only measured on request.
+
+
+class _Profiler:
+    def __init__(self, memory):
+        self.__stages = []
+        self.__start = time.perf_counter()
+        self.__memory = memory
+        self.__trace = memory and not tracemalloc.is_tracing()
+        if self.__trace:
+            tracemalloc.start()
+
+    def stage(self, stream, name):
+        # the stage is added immediately, so that the stages are listed in the order of the processing
+        return self.__measure_stage(stream, self.__add_stage(name))
+
+    def consumer(self, stream, name):
+        # measures the time, that is spent in processing the blocks after they have been yielded
+        return self.__measure_consumer(stream, self.__add_stage(name, consumer=True))
+
+    def __measure_stage(self, stream, stage):
+        iterator = iter(stream)
+        while True:
+            self.__begin_measurement()
+            start = time.perf_counter()
+            block = next(iterator, None)
+            self.__end_measurement(stage, time.perf_counter() - start)
+            if block is None:
+                break
+            stage["samples"] += len(block[0] if isinstance(block, tuple) else block)
+            yield block
+
+    def __measure_consumer(self, stream, stage):
+        for block in stream:
+            stage["samples"] += len(block)
+            self.__begin_measurement()
+            start = time.perf_counter()
+            yield block
+            self.__end_measurement(stage, time.perf_counter() - start)
+
+    def report(self, source, sampling_rate, length, workers):
+        duration = time.perf_counter() - self.__start
+        if self.__trace:
+            tracemalloc.stop()
+        stages = []
+        previous_time = 0.0
+        for stage in self.__stages:
+            if stage["consumer"]:
+                stage_time = stage["time"]
+            else:
+                stage_time, previous_time = stage["time"] - previous_time, stage["time"]
+            stages.append({
+                "name": stage["name"],
+                "time": stage_time,
+                "samples": stage["samples"],
+                "samples_per_second": stage["samples"] / stage_time if stage_time > 0.0 else None,
+                "peak_memory": stage["peak_memory"],
+            })
+        return {
+            "source": str(source),
+            "sampling_rate": sampling_rate,
+            "samples": length,
+            "workers": workers,
+            "time": duration,
+            "samples_per_second": length / duration,
+            "real_time_factor": length / sampling_rate / duration,
+            "stages": stages,
+        }
+
+    def __add_stage(self, name, consumer=False):
+        stage = {"name": name, "time": 0.0, "samples": 0, "peak_memory": 0 if self.__memory else None, "consumer": consumer}
+        self.__stages.append(stage)
+        return stage
+
+    def __begin_measurement(self):
+        if self.__memory:
+            tracemalloc.reset_peak()
+
+    def __end_measurement(self, stage, duration):
+        stage["time"] += duration
+        if self.__memory:
+            stage["peak_memory"] = max(stage["peak_memory"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()  # so that the next stage only measures its own peak
+
+
+def _profile(stream, name, profiler):
+    if profiler is None:
+        return stream
+    return profiler.stage(stream, name)
+
+
+def _format_profile(report):
+    lines = [f"{'stage':<24}{'time [s]':>10}{'samples/s':>14}{'peak memory [MB]':>18}"]
+    for stage in report["stages"]:
+        speed = f"{stage['samples_per_second']:14.3g}" if stage["samples_per_second"] else f"{'-':>14}"
+        memory = f"{stage['peak_memory'] / 2**20:18.1f}" if stage["peak_memory"] is not None else f"{'-':>18}"
+        lines.append(f"{stage['name']:<24}{stage['time']:10.3f}{speed}{memory}")
+    lines.append(f"{'total':<24}{report['time']:10.3f}{report['samples_per_second']:14.3g}"
+                 f"   ({report['real_time_factor']:.1f}x real time)")
+    return "\n".join(lines)
+
+
+###############################
+# Caching of the level values #
+###############################
+# Re-running the normalization with a different target level, headroom or limiter setting does not change
+# the level, so it can be cached. The cache consists of a .npy file with the level values in single
+# precision (with the decimated sampling rate) and a .json file with the metadata, which comprises a hash
+# of the source file's content and all the settings, that affect the level. The .json file is only written
+# after the level has been computed completely, so an interrupted run does not leave an invalid cache.
+
+
+def _level_cache_metadata_path(level_cache):
+    return os.path.splitext(level_cache)[0] + ".json"
+
+
+def _level_cache_metadata(level_cache, source, channel, settings, dtype, sampling_rate):
+    previous = _load_json(_level_cache_metadata_path(level_cache)) or {}
+    return {
+        "source": file_info(source, previous.get("source")),
+        "channel": channel,
+        "highpass_frequencies": [float(f) for f in settings["highpass_frequencies"]],
+        "notch_filter_frequencies": [float(f) for f in settings["notch_filter_frequencies"]],
+        "notch_filter_q_factor": float(settings["notch_filter_q_factor"]),
+        "level_smoothing": float(settings["level_smoothing"]),
+        "level_threshold": float(settings["level_threshold"]),
+        "level_decimation": settings["level_decimation"],
+        "link_channels": settings["link_channels"],
+        "fft_notch_filter": settings["fft_notch_filter"],
+        "dtype": numpy.dtype(dtype).name,
+        "sampling_rate": sampling_rate,
+    }
+
+
+def _load_json(path):
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+
+
+def _save_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def _store_levels(stream, store, offset, state=None):
+    # writes the side chain signal to the store array, starting with its value at the given offset, and
+    # rounds it to single precision, so that the result equals that of a later run with the cached values
+    state = {} if state is None else state
+    position = state.get("position", -offset)
+    for output, side_chain in stream:
+        dtype = side_chain.dtype
+        side_chain = side_chain.astype(numpy.float32)
+        begin, end = max(position, 0), min(position + len(side_chain), len(store))
+        if begin < end:
+            store[begin:end] = side_chain[begin-position:end-position]
+        position = state["position"] = position + len(side_chain)
+        yield output, side_chain.astype(dtype)
+
+
+def _attach_levels(stream, levels, factor, state=None):
+    # pairs the blocks of the audio signal with the cached level values, that have been computed with a
+    # sampling rate, that has been decimated by the given factor, by regrouping the blocks like decimate()
+    state = {} if state is None else state
+    position, rest = state.get("position", 0), state.get("rest")
+    for block in stream:
+        if rest is not None:
+            block = numpy.concatenate((rest, block))
+        length = len(block) // factor * factor
+        start = position
+        position, rest = state["position"], state["rest"] = position + length // factor, block[length:]
+        if length:
+            yield block[0:length], numpy.asarray(levels[start:position], dtype=block.dtype)
+    if rest is not None and len(rest):
+        yield rest, numpy.asarray(levels[position:position+1], dtype=rest.dtype)
+
+
+###############
+# Checkpoints #
+###############
+# For long recordings, the normalization can save checkpoints, from which an interrupted run is resumed.
+# The processing stages keep their states (the last samples of the filters, the values of the envelope
+# followers, the samples in the lookahead buffer of the limiter etc.) in dictionaries, which are saved in a
+# pickle file next to the target file together with the number of samples, that have been read, and the
+# number of frames, that have been written. A checkpoint is saved between two blocks, when all stages wait
+# for the next block, so the saved states are consistent. Since the resumed run reads its blocks at the
+# same positions as an uninterrupted run, it produces an identical file. The checkpoint also contains the
+# metadata of the source file and the settings, so that it is discarded, if any of them has changed.
+
+
+class _Checkpoint:
+    """Loads and saves the states of the processing stages for resuming an interrupted normalization.
+
+    If a checkpoint with matching metadata exists for the given target, its states, number of written
+    frames and state of the random generator for the dither are loaded and ``resumed`` is ``True``.
+    Otherwise, a previous checkpoint is deleted and the normalization starts from the beginning.
+    """
+
+    def __init__(self, target, metadata, interval):
+        self.path, self.segments = _checkpoint_paths(target)
+        self.__metadata = metadata
+        self.__interval = interval
+        self.__time = time.time()
+        data = None
+        if os.path.isfile(self.path):
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        self.resumed = data is not None and data["metadata"] == metadata
+        if self.resumed:
+            self.states, self.frames, self.random = data["states"], data["frames"], data["random"]
+        else:
+            _Checkpoint.remove(target)
+            self.states, self.frames, self.random = {}, 0, None
+
+    def due(self):
+        return time.time() - self.__time >= self.__interval
+
+    def save(self, frames, random):
+        # the checkpoint is written to a temporary file first, so that an interruption does not corrupt it
+        self.frames, self.random = frames, random
+        data = {"metadata": self.__metadata, "states": self.states, "frames": frames, "random": random}
+        with open(self.path + ".part", "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".part", self.path)
+        self.__time = time.time()
+
+    @staticmethod
+    def remove(target):
+        path, segments = _checkpoint_paths(target)
+        if os.path.isfile(path):
+            os.remove(path)
+        if os.path.isdir(segments):
+            shutil.rmtree(segments)
+
+
+def _checkpoint_paths(target):
+    # returns the paths of the checkpoint file and of the directory for the segments of the parallel processing
+    target = str(target[0] if isinstance(target, (list, tuple)) else target)
+    return target + ".checkpoint", target + ".segments"
+
+
+def _checkpoint_metadata(source, target, channel, settings, resolution, block_size, workers, dither, level_cache, reuse_levels, target_sampling_rate, dtype):
+    stat = os.stat(source)
+    metadata = {
+        "source": {"path": os.path.abspath(source), "size": stat.st_size, "mtime": stat.st_mtime_ns},
+        "target": [str(t) for t in target] if isinstance(target, (list, tuple)) else str(target),
+        "channel": channel,
+        "settings": settings,
+        "resolution": resolution,
+        "block_size": block_size,
+        "workers": workers,
+        "dither": dither,
+        "level_cache": None if level_cache is None else str(level_cache),
+        "reuse_levels": reuse_levels,
+        "target_sampling_rate": target_sampling_rate,
+        "dtype": numpy.dtype(dtype).name,
+    }
+    # the round trip through JSON converts NumPy arrays and scalars, so that the metadata can be compared with ==
+    return json.loads(json.dumps(metadata, default=lambda x: numpy.asarray(x).tolist()))
+
+
+def _read_position(stream, state):
+    # counts the samples, that have been read, so that a resumed run can continue reading after them
+    for block in stream:
+        state["position"] += len(block)
+        yield block
 
 
 ###################################
 # The signal processing functions #
 ###################################
+# The functions below are chained generators, that pass the audio signal as blocks of samples in NumPy
+# arrays. Stages, that compute a side chain signal, yield tuples of two arrays of equal length, with the
+# audio signal as the first and the side chain signal as the second element.
+
+
+def read(path, channel, block_size=2**16, start=0, stop=None, dtype=numpy.float64, follow=None, sampling_rate=None):
+    # channel is either the number of a channel, in which case the blocks are one dimensional arrays, or a
+    # list of channel numbers or "all", in which case the blocks have the shape (samples, channels). The
+    # dtype of the blocks determines the precision, with which all following stages compute their results.
+    # If follow is a number of seconds, the wav file is read while it is still being written, until it
+    # has not grown for that time (see _follow_wav). In this case, the returned length is None.
+    # Uncompressed wav files are read directly, other formats with the SoundFile library, if it is installed,
+    # or else with ffmpeg (see _ffmpeg_read). Only ffmpeg resamples the audio to the given sampling rate
+    # while decoding, so the returned sampling rate has to be checked.
+    if follow is not None:
+        layout = _wait_for_wav_layout(path, follow)
+        columns = _channel_columns(channel, layout.channels)
+        return _follow_wav(path, layout, columns, block_size, start, dtype, follow), float(layout.sampling_rate), None
+    layout = _wav_layout(path)
+    if layout is not None:
+        columns = _channel_columns(channel, layout.channels)
+        length = len(range(layout.frames)[start:stop])
 
+        def stream():
+            # the rows are sliced before the columns are selected, because selecting a list of columns copies
+            # the selected samples, which would read the whole file into memory
+            samples = _wav_samples(path, layout)
+            for i in range(start, start + length, block_size):
+                yield _wav_convert(samples[i:min(i + block_size, start + length)][:, columns], layout, dtype)
+            del samples
 
-def read(path, channel):
-    chunk_size = 2**14
+        return stream(), float(layout.sampling_rate), length
     try:
         import soundfile
-    except ImportError:
-        def stream():
-            with wave.open(str(path), "rb") as f:
-                number_of_channels = f.getnchannels()
-                if channel > number_of_channels:
-                    raise ValueError(f"The channel {channel} does not exist in the file with {number_of_channels} channels")
-                bits = f.getsampwidth()
-                code = {2: "h", 4: "i"}[bits]
-                factor = 1.0 / (2 ** (8 * f.getsampwidth() - 1))
-                chunk = f.readframes(chunk_size)
-                while chunk:
-                    number_of_frames = len(chunk) // bits
-                    mask = f"<{number_of_frames}{code}"
-                    yield from numpy.multiply(struct.unpack(mask, chunk)[channel-1::number_of_channels], factor)
-                    chunk = f.readframes(chunk_size)
-        with wave.open(str(path), "rb") as f:
-            sampling_rate = float(f.getframerate())
-            length = f.getnframes()
-        return stream(), sampling_rate, length
+        soundfile.info(path)
+    except (ImportError, RuntimeError):
+        if _ffmpeg_executable("ffmpeg") is None:
+            raise ValueError(f"Reading {path} is not supported, because it is not an uncompressed wav file.\n"
+                             "Change the file format or read the documentation about how to use the SoundFile library or ffmpeg to support additional formats.")
+        return _ffmpeg_read(path, channel, block_size, start, stop, dtype, sampling_rate)
     else:
         def stream():
             with soundfile.SoundFile(path) as f:
-                chunk = f.read(chunk_size, always_2d=True)
+                f.seek(start)
+                remaining = length
+                chunk = f.read(min(block_size, remaining), always_2d=True, dtype=numpy.dtype(dtype).name)
                 while len(chunk):
-                    yield from chunk[:, channel-1]
-                    chunk = f.read(chunk_size, always_2d=True)
+                    yield numpy.ascontiguousarray(chunk[:, columns])
+                    remaining -= len(chunk)
+                    chunk = f.read(min(block_size, remaining), always_2d=True, dtype=numpy.dtype(dtype).name)
         with soundfile.SoundFile(path) as f:
             sampling_rate = float(f.samplerate)
-            length = f.frames
+            length = len(range(f.frames)[start:stop])
+            columns = _channel_columns(channel, f.channels)
         return stream(), sampling_rate, length
 
-def _apply_iir_filter(stream, zb, za, copy_input=False):
-    coefficients = numpy.empty(len(zb) + len(za) - 1)
-    coefficients[0:len(zb)] = zb
-    coefficients[len(zb):] = -za[0:-1]
-    data_window = numpy.zeros(len(coefficients))
-    input_cache = data_window[0:len(zb)]
-    output_cache = data_window[len(zb):]
-    if copy_input:
-        for sample in stream:
-            input_cache[0:-1] = input_cache[1:]
-            input_cache[-1] = sample
-            filtered = numpy.dot(coefficients, data_window)
-            output_cache[0:-1] = output_cache[1:]
-            output_cache[-1] = filtered
-            yield sample, filtered
-    else:
-        for sample in stream:
-            input_cache[0:-1] = input_cache[1:]
-            input_cache[-1] = sample
-            filtered = numpy.dot(coefficients, data_window)
-            output_cache[0:-1] = output_cache[1:]
-            output_cache[-1] = filtered
+
+_follow_interval = 0.5  # the time in seconds between two checks, whether a file, that is followed, has grown
+
+
+def _wait_for_wav_layout(path, timeout):
+    # waits until the header of a wav file, that is being written, is complete
+    start = time.time()
+    while True:
+        layout = _wav_layout(path) if os.path.isfile(path) and os.path.getsize(path) >= 12 else None
+        if layout is not None:
+            return layout
+        if time.time() - start >= timeout:
+            raise ValueError(f"Cannot follow {path}, because it is not an uncompressed wav file.")
+        time.sleep(_follow_interval)
+
+
+def _follow_wav(path, layout, columns, block_size, start, dtype, timeout):
+    # Yields the samples of a wav file, that is still being written. As long as the file grows, only complete
+    # blocks are yielded, so the blocks are the same as when reading the finished file. Recorders usually
+    # write the size of the audio data to the header, when they close the file, so the file is considered
+    # finished, if the size in the header matches that of the file and the file has not grown since the
+    # previous check. Otherwise, it is considered finished, if it has not grown for the timeout in seconds.
+    position = start
+    size = changed = None
+    while True:
+        previous_size, size = size, os.path.getsize(path)
+        if size != previous_size:
+            changed = time.time()
+        frames = (size - layout.offset) // layout.block_align
+        with open(path, "rb") as f:
+            f.seek(layout.offset - 4)
+            data_size, = struct.unpack("<I", f.read(4))
+        finished = (size == previous_size and data_size == size - layout.offset) or time.time() - changed >= timeout
+        stop = frames if finished else position + (frames - position) // block_size * block_size
+        if stop > position:
+            samples = _wav_samples(path, layout._replace(frames=frames))
+            for i in range(position, stop, block_size):
+                yield _wav_convert(samples[i:min(i + block_size, stop)][:, columns], layout, dtype)
+            del samples
+            position = stop
+        if finished:
+            return
+        time.sleep(_follow_interval)
+
+
+def channel_count(path):
+    layout = _wav_layout(path)
+    if layout is not None:
+        return layout.channels
+    try:
+        import soundfile
+        return soundfile.info(path).channels
+    except (ImportError, RuntimeError):
+        return _ffprobe(path)[0]
+
+
+def _channel_columns(channel, channels):
+    # maps the channel selection of read() to an index for the columns of the samples array
+    if channel == "all":
+        return list(range(channels))
+    for c in [channel] if isinstance(channel, int) else channel:
+        if not 1 <= c <= channels:
+            raise ValueError(f"The channel {c} does not exist in the file with {channels} channels")
+    if isinstance(channel, int):
+        return channel - 1
+    return [c - 1 for c in channel]
+
+
+def _ffmpeg_executable(name):
+    # Blender does not always have /usr/local/bin in its search path (e.g. on MacOS, where Homebrew installs
+    # ffmpeg there), so the executable is also searched in that directory
+    return shutil.which(name) or shutil.which(name, path="/usr/local/bin")
+
+
+def _ffprobe(path):
+    # returns the number of channels, the sampling rate and the duration in seconds of the first audio stream
+    command = [_ffmpeg_executable("ffprobe"), "-v", "error", "-select_streams", "a:0",
+               "-show_entries", "stream=channels,sample_rate,duration:format=duration", "-of", "json", str(path)]
+    try:
+        information = json.loads(subprocess.run(command, check=True, capture_output=True).stdout)
+    except (TypeError, subprocess.CalledProcessError):
+        raise ValueError(f"Reading {path} is not supported, because ffprobe cannot determine the properties of its audio stream.")
+    if not information.get("streams"):
+        raise ValueError(f"Reading {path} is not supported, because it does not contain an audio stream.")
+    stream = information["streams"][0]
+    # some containers only specify the duration of the whole file
+    duration = stream.get("duration", information.get("format", {}).get("duration"))
+    if duration is None:
+        raise ValueError(f"Reading {path} is not supported, because ffprobe cannot determine the duration of its audio stream.")
+    return int(stream["channels"]), float(stream["sample_rate"]), float(duration)
+
+
+def _ffmpeg_read(path, channel, block_size, start, stop, dtype, sampling_rate):
+    # Decodes the first audio stream of any file, that ffmpeg supports (e.g. the speaker video), and streams
+    # the raw samples through a pipe, so no intermediate file is written. The channels are selected and the
+    # audio is resampled by ffmpeg's filters, and the samples before start are discarded sample-accurately
+    # by decoding and trimming them. The length is computed from the duration, that ffprobe reports, which
+    # can differ from the decoded number of samples by the padding of the codec, so the decoded samples are
+    # truncated or padded with silence to that length.
+    channels, source_sampling_rate, duration = _ffprobe(path)
+    columns = _channel_columns(channel, channels)
+    sampling_rate = source_sampling_rate if sampling_rate is None else float(int(round(sampling_rate)))
+    length = len(range(int(round(duration * sampling_rate)))[start:stop])
+    filters = []
+    if channel != "all":
+        selected = [columns] if isinstance(columns, int) else columns
+        layout = "mono" if isinstance(columns, int) else f"{len(selected)}c"
+        filters.append(f"pan={layout}|" + "|".join(f"c{i}=c{c}" for i, c in enumerate(selected)))
+    if sampling_rate != source_sampling_rate:
+        filters.append(f"aresample={int(sampling_rate)}")
+    if start:
+        filters.append(f"atrim=start_sample={start}")
+    sample_format = {"float32": "f32le", "float64": "f64le"}[numpy.dtype(dtype).name]
+    command = [_ffmpeg_executable("ffmpeg"), "-v", "error", "-nostdin", "-i", str(path), "-map", "0:a:0"]
+    command += ["-af", ",".join(filters)] if filters else []
+    command += ["-f", sample_format, "-"]
+    width = 1 if isinstance(columns, int) else channels if channel == "all" else len(columns)
+
+    def stream():
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+            try:
+                for position in range(0, length, block_size):
+                    count = min(block_size, length - position)
+                    buffer = bytearray(count * width * numpy.dtype(dtype).itemsize)
+                    received = process.stdout.readinto(memoryview(buffer))
+                    while received < len(buffer):
+                        chunk = process.stdout.readinto(memoryview(buffer)[received:])
+                        if not chunk:
+                            break
+                        received += chunk
+                    if received < len(buffer) and process.wait() != 0:
+                        errors.seek(0)
+                        raise ValueError(f"ffmpeg could not decode {path}:\n{errors.read().decode(errors='replace')}")
+                    block = numpy.frombuffer(buffer, dtype=dtype).reshape(count, width)
+                    yield block[:, 0] if isinstance(columns, int) else block
+            finally:
+                process.stdout.close()
+                process.kill()
+                process.wait()
+
+    return stream(), sampling_rate, length
+
+
+_WavLayout = collections.namedtuple("_WavLayout", ("format", "channels", "sampling_rate", "bits", "block_align", "offset", "frames"))
+
+
+def _wav_layout(path):
+    # Parses the header of a wav file and returns a _WavLayout tuple, or None, if the file is not a wav file
+    # with uncompressed integer or floating point samples. Besides the plain wav format, this supports
+    # WAVE_FORMAT_EXTENSIBLE headers and the RF64 format for files larger than 4GB.
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12:
+            return None
+        riff, _, wave_id = struct.unpack("<4sI4s", header)
+        if riff not in (b"RIFF", b"RF64") or wave_id != b"WAVE":
+            return None
+        data_size = None
+        layout = None
+        header = f.read(8)
+        while len(header) == 8:
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"ds64":
+                _, data_size, _ = struct.unpack("<QQQ", f.read(24))
+                f.seek(chunk_size - 24, os.SEEK_CUR)
+            elif chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                if len(fmt) < 16:
+                    return None  # the file is truncated or its header has not been written completely
+                format_tag, channels, sampling_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[0:16])
+                if format_tag == 0xFFFE and len(fmt) >= 26:
+                    format_tag, = struct.unpack("<H", fmt[24:26])  # the first bytes of the sub format GUID
+                layout = (format_tag, channels, sampling_rate, bits, block_align)
+            elif chunk_id == b"data":
+                if layout is None:
+                    return None
+                offset = f.tell()
+                if data_size is None or chunk_size != 0xFFFFFFFF:
+                    data_size = chunk_size
+                # recorders, that have not finished writing, might have written a wrong data size
+                data_size = min(data_size, file_size - offset)
+                layout = _WavLayout(*layout, offset=offset, frames=data_size // layout[4])
+                if (layout.format, layout.bits) not in _wav_formats:
+                    return None
+                return layout
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+            header = f.read(8)
+    return None
+
+
+# maps the format tag and the number of bits per sample to the data type and the scaling factor
+_wav_formats = {
+    (1, 16): ("<i2", 2.0 ** -15),
+    (1, 24): ("<i4", 2.0 ** -31),   # 24 bit samples are read into the upper bytes of 32 bit integers
+    (1, 32): ("<i4", 2.0 ** -31),
+    (3, 32): ("<f4", 1.0),
+    (3, 64): ("<f8", 1.0),
+}
+
+
+def _wav_samples(path, layout):
+    # Maps the samples of a wav file into memory and returns an array of shape (frames, channels) with the
+    # raw samples, without copying or reading them. For 24 bit files, the array has an additional axis for
+    # the three bytes of each sample.
+    if layout.frames == 0:
+        return numpy.empty((0, layout.channels) + ((3,) if layout.bits == 24 else ()), dtype=numpy.uint8)
+    data = numpy.memmap(path, dtype=numpy.uint8, mode="r", offset=layout.offset, shape=(layout.frames * layout.block_align,))
+    if layout.bits == 24:
+        return numpy.ndarray(shape=(layout.frames, layout.channels, 3), dtype=numpy.uint8, buffer=data,
+                             strides=(layout.block_align, 3, 1))
+    dtype = numpy.dtype(_wav_formats[(layout.format, layout.bits)][0])
+    return numpy.ndarray(shape=(layout.frames, layout.channels), dtype=dtype, buffer=data,
+                         strides=(layout.block_align, dtype.itemsize))
+
+
+def _wav_convert(samples, layout, dtype=numpy.float64):
+    # converts raw samples from _wav_samples to floating point values between -1.0 and 1.0
+    raw_dtype, factor = _wav_formats[(layout.format, layout.bits)]
+    if layout.bits == 24:
+        padded = numpy.zeros(samples.shape[0:-1] + (4,), dtype=numpy.uint8)
+        padded[..., 1:] = samples
+        samples = padded.view(raw_dtype)[..., 0]
+    return numpy.multiply(samples, factor, dtype=dtype)
+
+
+class _IIRFilter:
+    """Applies an IIR filter to blocks of samples and carries the filter state across the block boundaries.
+
+    The coefficients are given in the order of the per-sample implementation, that this class replaces,
+    which means, that ``zb[-1]`` and ``za[-1]`` are the coefficients for the current sample and ``za[-1]``
+    is normalized to ``1.0``.
+
+    Each block is processed as the sum of its zero-state response, which is the convolution with the
+    (truncated) impulse response of the filter, and the zero-input response of the filter state, that has
+    been left over from the previous blocks. The state is derived from the last inputs and outputs, just
+    like in the direct form implementation. The result equals that of a sample-by-sample evaluation of the
+    difference equation up to rounding errors. For the filters in this module, these errors stay below 1e-9
+    with respect to the signal's peak amplitude (about 1e-10 for a 50Hz notch filter with a Q-factor of 30
+    and about 1e-12 for the high pass and A-weighting filters, when compared to an evaluation in extended
+    precision). Filters with poles close to the unit circle should be split into second order sections,
+    because the impulse response of a single high order section becomes too large for an accurate
+    convolution.
+
+    The blocks are processed with the precision of their dtype. In single precision, the filter state is
+    still computed in double precision from the last inputs and outputs, so that the rounding errors of
+    one block do not accumulate over the following blocks.
+    """
+
+    def __init__(self, zb, za, block_size=2**16):
+        b = numpy.asarray(zb, dtype=float)[::-1]
+        a = numpy.asarray(za, dtype=float)[::-1]
+        order = max(len(a), len(b)) - 1
+        b = numpy.concatenate((b, numpy.zeros(order + 1 - len(b))))
+        a = numpy.concatenate((a, numpy.zeros(order + 1 - len(a))))
+        self.__order = order
+        self.__block_size = block_size
+        # the impulse response of the recursive part of the filter, which is computed by evaluating the
+        # difference equation, because matrix powers of the companion matrix are numerically unstable
+        recursive_response = numpy.empty(block_size)
+        feedback = [-c for c in a[1:]]
+        previous = [0.0] * order
+        value = 1.0
+        for n in range(block_size):
+            recursive_response[n] = value
+            previous.insert(0, value)
+            previous.pop()
+            value = sum(c * p for c, p in zip(feedback, previous))
+        # the zero-input response of the transposed direct form II, in which the response to a unit
+        # value in the i-th state variable is the recursive response delayed by i samples
+        self.__zero_input = numpy.zeros((block_size, order))
+        for i in range(order):
+            self.__zero_input[i:, i] = recursive_response[0:block_size-i]
+        # the impulse response, truncated to the block size
+        self.__impulse_response = numpy.convolve(b, recursive_response)[0:block_size]
+        self.__spectra = {}
+        self.__responses = {numpy.dtype(numpy.float64): (self.__impulse_response, self.__zero_input)}
+        # matrices for computing the filter state from the previous inputs and outputs (oldest first)
+        self.__input_to_state = numpy.zeros((order, order))
+        self.__output_to_state = numpy.zeros((order, order))
+        for i in range(order):
+            for m in range(order - i):
+                self.__input_to_state[i, order - 1 - m] = b[i + 1 + m]
+                self.__output_to_state[i, order - 1 - m] = a[i + 1 + m]
+        self.__inputs = self.__outputs = None
+
+    def __call__(self, block):
+        # the block can also be two dimensional with the channels in its columns
+        block = numpy.asarray(block)
+        if not numpy.issubdtype(block.dtype, numpy.floating):
+            block = block.astype(numpy.float64)
+        if self.__inputs is None:
+            self.__inputs = numpy.zeros((self.__order,) + block.shape[1:])
+            self.__outputs = numpy.zeros((self.__order,) + block.shape[1:])
+        result = numpy.empty(block.shape, dtype=block.dtype)
+        for start in range(0, len(block), self.__block_size):
+            chunk = block[start:start+self.__block_size]
+            result[start:start+len(chunk)] = self.__filter(chunk)
+        return result
+
+    def __filter(self, chunk):
+        length = len(chunk)
+        state = self.__input_to_state @ self.__inputs - self.__output_to_state @ self.__outputs
+        result = self.__convolve(chunk)
+        result += self.__response(chunk.dtype)[1][0:length] @ state.astype(chunk.dtype)
+        order = self.__order
+        self.__inputs = numpy.concatenate((self.__inputs, chunk[-order:]))[-order:]
+        self.__outputs = numpy.concatenate((self.__outputs, result[-order:]))[-order:]
+        return result
+
+    def __convolve(self, chunk):
+        length = len(chunk)
+        impulse_response = self.__response(chunk.dtype)[0]
+        if length <= 64:
+            if chunk.ndim > 1:
+                return numpy.stack([self.__convolve(c) for c in chunk.T], axis=1)
+            return numpy.convolve(chunk, impulse_response[0:length])[0:length]
+        fft_length = 2 ** int(math.ceil(math.log2(2 * length)))
+        key = (fft_length, chunk.dtype)
+        if key not in self.__spectra:
+            self.__spectra[key] = numpy.fft.rfft(impulse_response[0:fft_length//2], fft_length)
+        spectrum = numpy.fft.rfft(chunk, fft_length, axis=0)
+        spectrum *= _columns(self.__spectra[key], chunk)
+        return numpy.fft.irfft(spectrum, fft_length, axis=0)[0:length].astype(chunk.dtype, copy=False)
+
+    def __response(self, dtype):
+        # returns the impulse response and the zero-input response matrix in the given precision
+        if dtype not in self.__responses:
+            self.__responses[dtype] = tuple(r.astype(dtype) for r in self.__responses[numpy.dtype(numpy.float64)])
+        return self.__responses[dtype]
+
+    @property
+    def state(self):
+        """The last inputs and outputs, from which the filter state for the next block is computed."""
+        return self.__inputs, self.__outputs
+
+    @state.setter
+    def state(self, state):
+        self.__inputs, self.__outputs = state
+
+
+def _columns(values, like):
+    # reshapes a one dimensional array, so that it is broadcast along the columns of a multi-channel array
+    return numpy.reshape(values, values.shape + (1,) * (numpy.ndim(like) - numpy.ndim(values)))
+
+
+def _apply_iir_filter(stream, sections, copy_input=False, state=None):
+    filters = [_IIRFilter(zb, za) for zb, za in sections]
+    state = {} if state is None else state
+    for iir_filter, filter_state in zip(filters, state.get("filters", ())):
+        iir_filter.state = filter_state
+    for block in stream:
+        filtered = block
+        for iir_filter in filters:
+            filtered = iir_filter(filtered)
+        state["filters"] = [f.state for f in filters]
+        if copy_input:
+            yield block, filtered
+        else:
             yield filtered
 
 
-def highpass(stream, sampling_rate, frequency, order, regularization):
+def highpass(stream, sampling_rate, frequency, order, regularization, state=None):
     # compute the filter coefficients for a time-continuous Butterworth filter
     k = 1 / (2 * math.pi * frequency)
     if order == 1:
@@ -129,10 +969,10 @@ def highpass(stream, sampling_rate, frequency, order, regularization):
     zb *= k ** order
     za = numpy.divide(za, za[-1])
     # apply the filter to the stream
-    yield from _apply_iir_filter(stream, zb, za)
+    yield from _apply_iir_filter(stream, [(zb, za)], state=state)
 
 
-def notch_filter(stream, sampling_rate, frequency, q_factor, regularization):
+def notch_filter(stream, sampling_rate, frequency, q_factor, regularization, state=None):
     # compute the filter coefficients for a time-continuous notch filter
     w = 2 * math.pi * frequency
     a = (1, w / q_factor, w ** 2)
@@ -145,10 +985,44 @@ def notch_filter(stream, sampling_rate, frequency, q_factor, regularization):
     zb = numpy.divide(zb, za[-1])
     za = numpy.divide(za, za[-1])
     # apply the filter to the stream
-    yield from _apply_iir_filter(stream, zb, za)
+    yield from _apply_iir_filter(stream, [(zb, za)], state=state)
+
 
+def notch_filter_bank(stream, sampling_rate, frequencies, q_factor, decay=80.0, state=None):
+    # Attenuates all given frequencies in a single pass. The filter is the cascade of the time-continuous
+    # notch filters from notch_filter(), whose impulse response is computed from their combined frequency
+    # response and truncated, when it has decayed by the given number of dB. The filter is applied with an
+    # overlap-save FFT convolution, so the processing time depends on the length of the impulse response,
+    # which is determined by the narrowest notch, but not on the number of frequencies. Unlike the bilinear
+    # transform in notch_filter(), this does not shift the notches of high frequencies.
+    frequencies = list(frequencies)
+    decay_time = decay / 20 * math.log(10) * 2 * q_factor / (2 * math.pi * min(frequencies))
+    taps = 2 ** min(20, max(10, int(math.ceil(math.log2(decay_time * sampling_rate)))))
+    w = 2 * math.pi * numpy.fft.rfftfreq(taps, 1.0 / sampling_rate)
+    response = numpy.ones(len(w), dtype=complex)
+    for frequency in frequencies:
+        w0 = 2 * math.pi * frequency
+        response *= (w0 ** 2 - w ** 2) / (w0 ** 2 - w ** 2 + 1j * w * w0 / q_factor)
+    impulse_response = numpy.fft.irfft(response, taps)
+    fft_length = 2 * taps
+    step = fft_length - taps + 1  # the number of output samples per FFT
+    spectrum = numpy.fft.rfft(impulse_response, fft_length)
+    state = {} if state is None else state
+    history = state.get("history")
+    for block in stream:
+        if history is None:
+            history = numpy.zeros((taps - 1,) + block.shape[1:], dtype=block.dtype)
+        samples = numpy.concatenate((history, block))
+        result = numpy.empty(block.shape, dtype=block.dtype)
+        for start in range(0, len(block), step):
+            segment = samples[start:start+step+taps-1]
+            filtered = numpy.fft.irfft(numpy.fft.rfft(segment, fft_length, axis=0) * _columns(spectrum, segment), fft_length, axis=0)
+            result[start:start+len(segment)-taps+1] = filtered[taps-1:len(segment)]
+        history = state["history"] = samples[len(samples)-taps+1:]
+        yield result
 
-def a_weighting(stream, sampling_rate):
+
+def a_weighting(stream, sampling_rate, state=None):
     # compute the zeros and poles for a time-continuous A-weighting filter
     fr = 1000.0  # 1000Hz in IEC 61672-1
     fl = 10 ** 1.5  # f_L in IEC 61672-1:2013, Appendix E.2
@@ -168,117 +1042,354 @@ def a_weighting(stream, sampling_rate):
     f4 = ((-b + root) / 2) ** 0.5  # f_2 in IEC 61672-1
     zeros = (0.0,) * 4
     poles = numpy.multiply((f1, f1, f2, f3, f4, f4), -2 * math.pi)
-    # transform the zeros and poles with the matched-z-transform
-    num, den = (functools.reduce(numpy.polynomial.polynomial.polymul, ((-math.exp(x / sampling_rate), 1.0) for x in d)) for d in (zeros, poles))
+    # transform the zeros and poles with the matched-z-transform and group them into second order sections,
+    # because a single sixth order filter with four poles close to z=1 amplifies the rounding errors too much
+    sections = []
+    for section_zeros, section_poles in ((zeros[0:2], poles[0:2]), (zeros[2:4], poles[2:4]), ((), poles[4:6])):
+        zb, za = (functools.reduce(numpy.polynomial.polynomial.polymul, ((-math.exp(x / sampling_rate), 1.0) for x in d), (1.0,)) for d in (section_zeros, section_poles))
+        sections.append((zb, za))
     gain = 10 ** (2.446165 / 20)
-    zb, za = numpy.divide(num, gain*den[-1]), numpy.divide(den, den[-1])
+    sections[0] = (numpy.divide(sections[0][0], gain), sections[0][1])
     # apply the filter to the stream
-    yield from _apply_iir_filter(stream, zb, za, copy_input=True)
+    yield from _apply_iir_filter(stream, sections, copy_input=True, state=state)
+
+
+def _initial_blocks(stream, length):
+    # reads blocks from a stream of (output, side_chain) tuples, until they contain the given number of
+    # samples and returns them together with the RMS of their side chain signal
+    blocks = []
+    count = 0
+    for block in stream:
+        blocks.append(block)
+        count += len(block[1])
+        if count >= length:
+            break
+    first = numpy.concatenate([side_chain for _, side_chain in blocks])[0:length]
+    if first.ndim > 1:
+        return blocks, numpy.sqrt(numpy.mean(numpy.square(first), axis=0))
+    return blocks, numpy.linalg.norm(first) / math.sqrt(len(first))
+
+
+def _pending_blocks(pending, stream):
+    # yields the blocks, that _initial_blocks has read ahead, and then those of the stream. Unlike
+    # itertools.chain, this removes the blocks from the deque, so that it can be saved in a checkpoint
+    while pending:
+        yield pending.popleft()
+    yield from stream
+
+
+def _one_pole(values, smoothing, initial):
+    # evaluates the recurrence y[n] = smoothing * y[n-1] + (1 - smoothing) * values[n] with y[-1] = initial
+    # for a whole array as the convolution with the exponentially decaying impulse response
+    # (values can also be two dimensional with one channel per column and one initial value per channel).
+    # The values must not be negative. The result is always computed in double precision, because the
+    # rounding errors of the FFT are relative to the largest value in the array, so that they would dominate
+    # the envelope of quiet passages in single precision. Even in double precision, the envelope of digital
+    # silence decays below these rounding errors, so that it would become slightly negative without
+    # clamping it to zero.
+    values = numpy.asarray(values, dtype=numpy.float64)
+    length = len(values)
+    if length <= 64:
+        powers = numpy.power(smoothing, numpy.arange(length))
+        if values.ndim > 1:
+            result = numpy.stack([numpy.convolve(v, powers)[0:length] for v in values.T], axis=1)
+        else:
+            result = numpy.convolve(values, powers)[0:length]
+    else:
+        fft_length = 2 ** int(math.ceil(math.log2(2 * length)))
+        powers, power_spectrum = _one_pole_response(smoothing, fft_length)
+        powers = powers[0:length]
+        spectrum = numpy.fft.rfft(values, fft_length, axis=0)
+        spectrum *= _columns(power_spectrum, values)
+        result = numpy.fft.irfft(spectrum, fft_length, axis=0)[0:length]
+    result *= 1.0 - smoothing
+    result += initial * smoothing * _columns(powers, values)
+    return numpy.maximum(result, 0.0, out=result)
 
 
-def activity(stream, sampling_rate, smoothing_time):
+@functools.lru_cache(maxsize=64)
+def _one_pole_response(smoothing, fft_length):
+    # the (unscaled) impulse response of the one-pole filter in _one_pole and its spectrum
+    powers = numpy.power(smoothing, numpy.arange(fft_length // 2))
+    return powers, numpy.fft.rfft(powers, fft_length)
+
+
+def _find_first(condition, values, start):
+    # returns the index of the first value from start on, for which the condition is true, or the length
+    # of the array, if there is no such value. The values are searched in windows of growing size, so
+    # that finding the end of a short run does not cost a pass over the whole array
+    window = 256
+    while start < len(values):
+        indices = numpy.flatnonzero(condition(values[start:start+window]))
+        if len(indices):
+            return start + indices[0]
+        start += window
+        window *= 2
+    return len(values)
+
+
+def activity(stream, sampling_rate, smoothing_time, state=None):
     stream = iter(stream)
     smoothing = numpy.exp(-2*math.pi / (smoothing_time * sampling_rate))
-    first = numpy.empty(shape=(int(round(sampling_rate * smoothing_time)), 2))
-    for i, sample in zip(range(len(first)), stream):
-        first[i] = sample
-    first = first[0:i+1]
-    envelope0 = envelope1 = numpy.linalg.norm(first[:, 1]) / math.sqrt(len(first))
-    for data in (first, stream):
-        for output, side_chain in data:
-            squared = side_chain ** 2
-            envelope0 = (envelope0 - squared) * smoothing + squared
-            envelope1 = (envelope1 - envelope0) * smoothing + envelope0
-            yield output, math.sqrt(envelope1)
-        first = None
-
-
-def level(stream, sampling_rate, smoothing_time, threshold):
+    state = {} if state is None else state
+    if "pending" in state:
+        pending, envelope0, envelope1 = state["pending"], state["envelope0"], state["envelope1"]
+    else:
+        first, envelope0 = _initial_blocks(stream, int(round(sampling_rate * smoothing_time)))
+        pending, envelope1 = collections.deque(first), envelope0
+    for output, side_chain in _pending_blocks(pending, stream):
+        smoothed0 = _one_pole(numpy.square(side_chain), smoothing, envelope0)
+        smoothed1 = _one_pole(smoothed0, smoothing, envelope1)
+        envelope0, envelope1 = smoothed0[-1], smoothed1[-1]
+        state.update(pending=pending, envelope0=envelope0, envelope1=envelope1)
+        yield output, numpy.sqrt(smoothed1).astype(side_chain.dtype, copy=False)
+
+
+def level(stream, sampling_rate, smoothing_time, threshold, state=None):
     stream = iter(stream)
     smoothing = numpy.exp(-2*math.pi / (smoothing_time * sampling_rate))
-    first = numpy.empty(shape=(int(round(sampling_rate * smoothing_time)), 2))
-    for i, sample in zip(range(len(first)), stream):
-        first[i] = sample
-    first = first[0:i+1]
-    envelope0 = envelope1 = numpy.linalg.norm(first[:, 1]) / math.sqrt(len(first))
+    state = {} if state is None else state
+    if "pending" in state:
+        pending, states = state["pending"], state["states"]
+    else:
+        first, envelope0 = _initial_blocks(stream, int(round(sampling_rate * smoothing_time)))
+        pending = collections.deque(first)
+        # the gating depends on the signal, so the channels of a multi-channel side chain are followed separately
+        states = [(e, e, 2**16) for e in numpy.ravel(envelope0)]
     threshold_factor = 10.0 ** (threshold / 20.0)
-    for data in (first, stream):
-        for output, side_chain in data:
-            activity = 0
-            if side_chain >= envelope1 * threshold_factor:
-                envelope0 = (envelope0 - side_chain) * smoothing + side_chain
-                envelope1 = (envelope1 - envelope0) * smoothing + envelope0
-                activity = 0.5
-            yield output, envelope1
-        first = None
+
+    def follow(side_chain, envelope0, envelope1, probe):
+        envelope = numpy.empty(len(side_chain), dtype=side_chain.dtype)
+        position = 0
+        while position < len(side_chain):
+            # the envelope is held, while the side chain is below the threshold
+            start = _find_first(lambda s: s >= envelope1 * threshold_factor, side_chain, position)
+            envelope[position:start] = envelope1
+            position = start
+            if position == len(side_chain):
+                break
+            # smooth the following samples under the assumption, that they are all above the threshold,
+            # and keep the result up to the first sample, that is not
+            chunk = side_chain[position:position+probe]
+            smoothed0 = _one_pole(chunk, smoothing, envelope0)
+            smoothed1 = _one_pole(smoothed0, smoothing, envelope1)
+            below = numpy.flatnonzero(chunk[1:] < smoothed1[0:-1] * threshold_factor)
+            count = below[0] + 1 if len(below) else len(chunk)
+            envelope[position:position+count] = smoothed1[0:count]
+            envelope0, envelope1 = smoothed0[count-1], smoothed1[count-1]
+            position += count
+            # the probe length is limited, because it would otherwise double with every block, that ends above
+            # the threshold, until it can no longer be used as an index
+            probe = max(256, 2 * count) if count < len(chunk) else min(2 * probe, 2**40)
+        return envelope, (envelope0, envelope1, probe)
+
+    for output, side_chain in _pending_blocks(pending, stream):
+        if side_chain.ndim > 1:
+            envelopes = []
+            for i, column in enumerate(side_chain.T):
+                envelope, states[i] = follow(column, *states[i])
+                envelopes.append(envelope)
+            envelope = numpy.stack(envelopes, axis=1)
+        else:
+            envelope, states[0] = follow(side_chain, *states[0])
+        state.update(pending=pending, states=states)
+        yield output, envelope
+
+
+def decimate(stream, factor, state=None):
+    # Reduces the sampling rate of the side chain signal by replacing groups of samples with their RMS
+    # value. Since the envelope followers smooth the squared side chain signal, this is equivalent to an
+    # anti-aliasing filter with a rectangular impulse response. The audio signal is passed through, but
+    # its blocks are regrouped, so that each side chain sample refers to the same number of audio samples.
+    state = {} if state is None else state
+    output_rest, side_chain_rest = state.get("rest", (None, None))
+    for output, side_chain in stream:
+        if output_rest is not None:
+            output = numpy.concatenate((output_rest, output))
+            side_chain = numpy.concatenate((side_chain_rest, side_chain))
+        length = len(side_chain) // factor * factor
+        output_rest, side_chain_rest = state["rest"] = output[length:], side_chain[length:]
+        if length:
+            power = numpy.square(side_chain[0:length]).reshape((-1, factor) + side_chain.shape[1:]).mean(axis=1)
+            yield output[0:length], numpy.sqrt(power)
+    if side_chain_rest is not None and len(side_chain_rest):
+        yield output_rest, numpy.sqrt(numpy.square(side_chain_rest).mean(axis=0, keepdims=True))
+
+
+def interpolate(stream, factor, state=None):
+    # Increases the sampling rate of a side chain signal, that has been decimated by the given factor, to
+    # that of the audio signal by linear interpolation. Each side chain sample is assigned to the last audio
+    # sample of its group, so that no look ahead into the next block is necessary.
+    state = {} if state is None else state
+    previous = state.get("previous")
+    for output, side_chain in stream:
+        if previous is None:
+            previous = side_chain[0]
+        positions = numpy.concatenate(((-1,), numpy.minimum(numpy.arange(1, len(side_chain) + 1) * factor, len(output)) - 1))
+        values = numpy.concatenate(([previous], side_chain))
+        if values.ndim > 1:
+            interpolated = numpy.stack([numpy.interp(numpy.arange(len(output)), positions, v) for v in values.T], axis=1)
+        else:
+            interpolated = numpy.interp(numpy.arange(len(output)), positions, values)
+        previous = state["previous"] = side_chain[-1]
+        yield output, interpolated.astype(side_chain.dtype, copy=False)
+
+
+def combine_channels(stream):
+    # combines the side chain signals of multiple channels to their RMS value, so that the same gain is
+    # applied to all channels and their relative levels are preserved
+    for output, side_chain in stream:
+        if side_chain.ndim > 1:
+            side_chain = numpy.sqrt(numpy.mean(numpy.square(side_chain), axis=1))
+        yield output, side_chain
 
 
 def normalization(stream, level):
     target_level = 10.0 ** (level / 20.0)
     for output, side_chain in stream:
-        yield output * target_level / side_chain
+        yield output * target_level / _columns(side_chain, output)
 
 
-def limiter(stream, sampling_rate, clip, lookahead, hold):
-    stream = iter(stream)
+def limiter(stream, sampling_rate, clip, lookahead, hold, link=True, state=None):
+    # The gain for each sample is the moving average over the lookahead time of the minimum required gain
+    # within the hold and lookahead times around the respective sample. This guarantees, that the gain is
+    # lower than the required gain for the peak, while the gain is reduced linearly over the lookahead time
+    # before a peak, held for the hold time after it and then released linearly over the lookahead time.
+    # For multi-channel signals, the gain is either computed from the highest peak of all channels (link)
+    # or separately for each channel.
     peak = 10.0 ** (clip / 20.0)
-    length = int(round(lookahead * sampling_rate))
-    buffer = numpy.zeros(length)
-    gain_buffer = numpy.ones(length)
-    ones = itertools.cycle((1.0, ))
-    hold = numpy.empty(int(round(hold * sampling_rate)))
-    release = None
-    for i, sample in zip(range(length), stream):
-        buffer[i] = sample
-    amplitude = max(numpy.abs(buffer))
-    if amplitude > peak:
-        target_gain = peak / amplitude
-        gain_buffer[:] = target_gain
-        release = numpy.linspace(target_gain, 1.0, length)
-        state = release
-    else:
-        state = ones
-    target_gain = 1.0
-    i = 0
-    while True:
-        for sample, gain in zip(stream, state):
-            current_gain = gain_buffer[i]
-            amplitude = abs(sample)
-            yield buffer[i] * current_gain
-            buffer[i] = sample
-            gain_buffer[i] = gain
-            i = (i + 1) % length
-            if amplitude * gain > peak:
-                target_gain = min(target_gain, peak / amplitude)
-                slope = (target_gain - current_gain) / length
-                slope = min(gain_buffer[i] - current_gain, slope)
-                if slope == 0:
-                    gain_buffer[:] = target_gain
-                    release = numpy.linspace(target_gain, 1.0, length)
-                    state = release
-                else:
-                    attack = numpy.arange(current_gain + slope, target_gain, slope)
-                    gain_buffer[0:len(attack)] = attack
-                    gain_buffer[len(attack):] = target_gain
-                    gain_buffer = numpy.roll(gain_buffer, i)
-                    hold[:] = target_gain
-                    state = hold
-                break
+    length = max(1, int(round(lookahead * sampling_rate)))
+    hold = int(round(hold * sampling_rate))
+
+    def gains(samples, history, count):
+        peaks = numpy.abs(samples)
+        if link and peaks.ndim > 1:
+            peaks = peaks.max(axis=1)
+        required = numpy.concatenate((history, peak / numpy.maximum(peaks, peak)))
+        windowed = _sliding_minimum(required, hold + length)
+        # the cumulative sum is computed in double precision, because its values grow with the block length
+        cumulative = numpy.concatenate((numpy.zeros((1,) + windowed.shape[1:]), numpy.cumsum(windowed, axis=0, dtype=numpy.float64)))
+        gain = (cumulative[length:length+count] - cumulative[0:count]) / length
+        # remove the rounding errors of the cumulative sum, which might lead to a gain above the required one
+        gain = numpy.minimum(gain, required[len(history):len(history)+count], dtype=samples.dtype)
+        return _columns(gain, samples), required
+
+    state = {} if state is None else state
+    samples, history = state.get("samples"), state.get("history")
+    for block in stream:
+        if samples is None:
+            samples = block[0:0]
+            # the required gains before the samples, that are not yet processed
+            history = numpy.ones((length - 1 + hold,) + (block.shape[1:] if not link else ()), dtype=block.dtype)
+        samples = numpy.concatenate((samples, block))
+        count = len(samples) - length
+        if count > 0:
+            gain, required = gains(samples, history, count)
+            limited = _clip(samples[0:count] * gain, peak)
+            history = required[count:count+len(history)]
+            samples = samples[count:]
+        state.update(samples=samples, history=history)
+        if count > 0:
+            yield limited
+    if samples is None:
+        return
+    # the last samples are limited as if they were followed by silence and faded out
+    gain, _ = gains(numpy.concatenate((samples, numpy.zeros((length - 1,) + samples.shape[1:], dtype=samples.dtype))), history, len(samples))
+    gain *= _columns(numpy.blackman(2 * length)[2*length-len(samples):], gain)
+    yield _clip(samples * gain, peak)
+
+
+def _clip(samples, peak):
+    # the product of a peak and its required gain can exceed the peak by a rounding error, which is removed
+    # here, so that the limited samples never exceed the peak
+    return numpy.clip(samples, -peak, peak, out=samples)
+
+
+def _sliding_minimum(values, window):
+    # computes the minimum of all windows of the given length with the van Herk/Gil-Werman algorithm, which
+    # combines the running minima from the end and from the beginning of blocks with the window length
+    # (for two dimensional values, the minima are computed along the first axis)
+    length = len(values) - window + 1
+    channels = values.shape[1:]
+    if length <= 0:
+        return numpy.empty((0,) + channels)
+    padded = numpy.full((-(-len(values) // window) * window,) + channels, numpy.inf, dtype=values.dtype)
+    padded[0:len(values)] = values
+    blocks = padded.reshape((-1, window) + channels)
+    from_beginning = numpy.minimum.accumulate(blocks, axis=1).reshape(padded.shape)
+    from_end = numpy.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    return numpy.minimum(from_end[0:length], from_beginning[window-1:window-1+length])
+
+
+def resample(stream, sampling_rate, target_sampling_rate, taps=64, rolloff=0.95, state=None):
+    # Changes the sampling rate by the rational factor up/down with a polyphase FIR filter. Conceptually,
+    # the signal is upsampled by inserting up-1 zeros between its samples, filtered with a windowed sinc
+    # low pass and every down-th sample is kept. The polyphase implementation only evaluates the products
+    # with the non-zero samples, so each output sample is the dot product of taps input samples with one of
+    # the up phases of the filter. Since every up-th output sample uses the same phase and input samples,
+    # that are down samples apart, the output samples are computed in groups of the same phase as the
+    # product of a strided view of the input with the phase's coefficients. The filter is centered on the
+    # output samples, so the signal is not delayed, and its cutoff is at the rolloff fraction of the lower
+    # Nyquist frequency. When resampling 48kHz to 44.1kHz, the frequency response is flat up to 19kHz and
+    # aliases are attenuated by more than 75dB.
+    up, down = int(round(target_sampling_rate)), int(round(sampling_rate))
+    divisor = math.gcd(up, down)
+    up, down = up // divisor, down // divisor
+    length = taps * up
+    center = length // 2
+    cutoff = rolloff / max(up, down)
+    h = up * cutoff * numpy.sinc(cutoff * (numpy.arange(length) - center)) * numpy.kaiser(length, 8.0)
+    phases = h.reshape(taps, up).T[:, ::-1].copy()  # phases[p, taps-1-k] = h[p + k * up]
+    # the output sample n is computed from the input samples (n * down + center) // up - k for k < taps
+    first = center // up - taps + 1  # the index of the first input sample, that is needed for the output
+    samples = None
+    offset = first  # the index of the first sample in the samples array
+    n = 0  # the index of the next output sample
+    count = 0  # the number of input samples
+    output_chunk = 2**16
+    state = {} if state is None else state
+    if state:
+        samples, offset, n, count = state["samples"], state["offset"], state["n"], state["count"]
+
+    def compute(samples, n, stop):
+        result = numpy.empty((stop - n,) + samples.shape[1:], dtype=samples.dtype)
+        coefficients = phases.astype(samples.dtype, copy=False)
+        windows = numpy.lib.stride_tricks.sliding_window_view(samples, taps, axis=0)  # windows[i] = samples[i:i+taps]
+        for i in range(min(up, stop - n)):
+            position = (n + i) * down + center
+            start = position // up - taps + 1 - offset
+            count = len(range(n + i, stop, up))
+            result[i::up] = windows[start:start+(count-1)*down+1:down] @ coefficients[position % up]
+        return result
+
+    for block in itertools.chain(stream, [None]):
+        if block is None:
+            # the input is followed by silence, until all output samples have been computed
+            if samples is None:
+                return
+            total = -(-count * up // down)
+            block = numpy.zeros((max(0, ((total - 1) * down + center) // up - count + 1),) + samples.shape[1:], dtype=samples.dtype)
         else:
-            if state is hold:
-                release = numpy.linspace(target_gain, 1.0, length)
-                state = release
-            elif state is release:
-                target_gain = 1.0
-                state = ones
-            elif state is ones:
-                break
-    buffer = numpy.roll(buffer, -i)
-    gain_buffer = numpy.roll(gain_buffer, -i)
-    fade_out = numpy.blackman(2*length)[length:]
-    gain_buffer *= fade_out
-    for sample, gain in zip(buffer, gain_buffer):
-        yield sample * gain
+            count += len(block)
+            total = None
+        if samples is None:
+            samples = numpy.zeros((-first,) + block.shape[1:], dtype=block.dtype)
+        samples = numpy.concatenate((samples, block))
+        available = offset + len(samples)  # the index after the last available input sample
+        stop = (available * up - center - 1) // down + 1  # the first output sample, that needs more input
+        if total is not None:
+            stop = total
+        while n < stop:
+            chunk_stop = min(stop, n + output_chunk)
+            chunk = compute(samples, n, chunk_stop)
+            n = chunk_stop
+            state.update(samples=samples, offset=offset, n=n, count=count)
+            yield chunk
+        # discard the input samples, that are no longer needed
+        needed = (n * down + center) // up - taps + 1 - offset
+        if needed > 0:
+            samples = samples[needed:]
+            offset += needed
 
 
 def status(stream, length):
@@ -287,60 +1398,178 @@ def status(stream, length):
     run = True
     def poll_information():
         while run:
-            print(f"processing the audio track: {i / length * 100:4.1f}% ({int(round(time.time() - start))}s)", end="\r")
+            # the length is unknown, while a growing file is followed
+            progress = f"{i} samples" if length is None else f"{i / length * 100:4.1f}%"
+            print(f"processing the audio track: {progress} ({int(round(time.time() - start))}s)", end="\r")
             time.sleep(2)
     thread = threading.Thread(target=poll_information)
     thread.daemon = True
     thread.start()
-    for i, sample in enumerate(stream):
-        yield sample
+    for block in stream:
+        yield block
+        i += len(block)
     run = False
     thread.join()
     duration = time.time() - start
     print(f"processing the audio track: done in {int(duration / 60)}:{int(round(duration % 60))} minutes")
 
 
-def write(stream, sampling_rate, path, bits):
-    buffer_size = 2**14 * 8 // bits # buffer 16kB of the outbut file before writing them to the file
-    buffer = numpy.empty(buffer_size)
-    factor = 2 ** (bits - 1) - 1
-    code = {16: "h", 32: "i"}[bits]
+_write_buffer_size = 2**22  # the number of bytes, that are collected before writing them to the file at once
+
+
+def write(stream, sampling_rate, path, bits, dither=False, checkpoint=None, follow=False):
+    # Writes the blocks to the file at the given path and returns the number of written frames. Two
+    # dimensional blocks are written as a multi-channel file, unless a list of paths is given, in which case
+    # each channel is written to a separate file. With a _Checkpoint, the writing continues after the frames
+    # of the checkpoint, and new checkpoints are saved after the written frames have been flushed to the
+    # file. With follow, each block is appended to the file immediately and the header is updated, so that
+    # the file can be read, while the source is still being followed.
+    random = numpy.random.default_rng(0) if dither else None
+    frames = 0
+    if checkpoint is not None:
+        frames = checkpoint.frames
+        if random is not None and checkpoint.random is not None:
+            random.bit_generator.state = checkpoint.random
+    paths = list(path) if isinstance(path, (list, tuple)) else [path]
+    for p in paths:
+        if str(p).lower().endswith(".wav"):
+            if bits not in (16, 24, 32):
+                raise ValueError("Writing wav files with other resolutions than 16, 24 or 32 bits is not supported.")
+        else:
+            try:
+                import soundfile
+            except ImportError:
+                raise ValueError("Writing files other than wav files is not supported.\n"
+                                 "Change the file format or read the documentation about how to use the SoundFile library to support additional formats.")
+    writers = []
     try:
-        import soundfile
-    except ImportError:
-        if not str(path).lower().endswith(".wav") or bits not in (16, 32):
-            raise ValueError("Writing files other than 16 or 32 bit wav files is not supported.\n"
-                             "Change the file format or read the documentation about how to use the SoundFile library to support additional formats.")
-        with wave.open(str(path), "wb") as f:
-            f.setnchannels(1)
-            f.setsampwidth(bits // 8)
-            f.setframerate(int(round(sampling_rate)))
-            while True:
-                i = -1
-                for i, sample in zip(range(buffer_size), stream):
-                    buffer[i] = sample
-                if i >= 0:
-                    b = buffer[0:i+1]
-                    b *= factor
-                    mask = f"<{len(b)}{code}"
-                    integers = numpy.round(b).astype(int)
-                    chunk = struct.pack(mask, *integers)
-                    f.writeframes(chunk)
-                else:
-                    break
-    else:
-        file_format = {".wav": "WAV", ".flac": "FLAC"}[os.path.splitext(path)[1]]
-        with soundfile.SoundFile(path, mode="w",
-                                 samplerate=int(round(sampling_rate)), channels=1,
-                                 format=file_format, subtype=f"PCM_{bits}") as f:
-            while True:
-                i = -1
-                for i, sample in zip(range(buffer_size), stream):
-                    buffer[i] = sample
-                if i >= 0:
-                    f.write(buffer[0:i+1])
-                else:
-                    break
+        for block in stream:
+            if not writers:
+                channels = 1 if block.ndim == 1 or len(paths) > 1 else block.shape[1]
+                writers.extend(_Writer(p, sampling_rate, bits, channels, random, resume_frames=frames) for p in paths)
+            if len(paths) > 1:
+                for i, writer in enumerate(writers):
+                    writer.write(block[:, i])
+            else:
+                writers[0].write(block)
+            frames += len(block)
+            if follow:
+                for writer in writers:
+                    writer.update()
+            if checkpoint is not None and checkpoint.due():
+                for writer in writers:
+                    writer.flush()
+                checkpoint.save(frames=frames, random=None if random is None else random.bit_generator.state)
+        if not writers:
+            writers.extend(_Writer(p, sampling_rate, bits, 1, random) for p in paths)
+    finally:
+        for writer in writers:
+            writer.close()
+    return frames
+
+
+class _Writer:
+    """Writes blocks of floating point samples to an audio file with the given resolution.
+
+    For wav files, the samples are converted to bytes with ``_pcm`` and collected in a buffer of
+    ``_write_buffer_size`` bytes, so that the file is written in large chunks. The header is the same as
+    that of the wave module from Python's standard library. Its sizes are updated, when the file is closed,
+    so the writing of a wav file, that has been interrupted, can be resumed after a given number of frames.
+    Other formats require the SoundFile library.
+    """
+
+    def __init__(self, path, sampling_rate, bits, channels, random, resume_frames=0):
+        self.__bits = bits
+        self.__random = random
+        if str(path).lower().endswith(".wav"):
+            self.__format = (channels, int(round(sampling_rate)), bits)
+            self.__frames = resume_frames
+            block_align = channels * bits // 8
+            if resume_frames:
+                layout = _wav_layout(path)
+                if layout is None or (layout.format, layout.channels, layout.sampling_rate, layout.bits, layout.offset) != (1,) + self.__format + (44,) or \
+                        os.path.getsize(path) < layout.offset + resume_frames * block_align:
+                    raise ValueError(f"Cannot resume writing {path}, because the file does not match the checkpoint.")
+                self.__file = open(path, "r+b")
+                self.__file.seek(layout.offset + resume_frames * block_align)
+                self.__file.truncate()
+            else:
+                self.__file = open(path, "wb")
+                self.__file.write(self.__header())
+            self.__soundfile = False
+        else:
+            import soundfile
+            file_format = {".wav": "WAV", ".flac": "FLAC"}[os.path.splitext(path)[1]]
+            self.__file = soundfile.SoundFile(path, mode="w",
+                                              samplerate=int(round(sampling_rate)), channels=channels,
+                                              format=file_format, subtype=f"PCM_{bits}")
+            self.__soundfile = True
+        self.__buffer = []
+        self.__buffered = 0
+
+    def write(self, block):
+        if self.__soundfile:
+            if self.__random is not None:
+                factor = 2 ** (self.__bits - 1) - 1
+                block = block + (self.__random.random(block.shape) - self.__random.random(block.shape)) / factor
+            self.__file.write(block)
+        else:
+            self.__buffer.append(_pcm(block, self.__bits, self.__random))
+            self.__buffered += len(self.__buffer[-1])
+            self.__frames += len(block)
+            if self.__buffered >= _write_buffer_size:
+                self.__flush()
+
+    def flush(self):
+        # writes the buffered frames and makes sure, that they are stored on the disk
+        if not self.__soundfile:
+            self.__flush()
+        self.__file.flush()
+        if not self.__soundfile:
+            os.fsync(self.__file.fileno())
+
+    def update(self):
+        # writes the buffered frames and the header with the current sizes
+        if self.__soundfile:
+            self.__file.flush()
+        else:
+            self.__flush()
+            self.__file.seek(0)
+            self.__file.write(self.__header())
+            self.__file.seek(0, os.SEEK_END)
+            self.__file.flush()
+
+    def close(self):
+        self.update()
+        self.__file.close()
+
+    def __flush(self):
+        self.__file.write(b"".join(self.__buffer))
+        self.__buffer.clear()
+        self.__buffered = 0
+
+    def __header(self):
+        channels, sampling_rate, bits = self.__format
+        block_align = channels * bits // 8
+        data_size = self.__frames * block_align
+        return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, channels,
+                           sampling_rate, sampling_rate * block_align, block_align, bits, b"data", data_size)
+
+
+def _pcm(samples, bits, random=None):
+    # Converts floating point samples to the bytes of little endian integers with the given resolution. If
+    # a random generator is given, triangular dither with an amplitude of one least significant bit is added.
+    factor = 2 ** (bits - 1) - 1
+    # single precision cannot represent all 32 bit integers, so the conversion is done in double precision
+    scaled = numpy.multiply(samples, factor, dtype=numpy.float64 if bits > 24 else None)
+    if random is not None:
+        scaled += random.random(scaled.shape)
+        scaled -= random.random(scaled.shape)
+    numpy.round(scaled, out=scaled)
+    numpy.clip(scaled, -factor - 1, factor, out=scaled)
+    if bits == 24:
+        return scaled.astype("<i4").view(numpy.uint8).reshape(-1, 4)[:, 0:3].tobytes()
+    return scaled.astype(f"<i{bits // 8}").tobytes()
 
 
 ##############################################
@@ -350,31 +1579,66 @@ def write(stream, sampling_rate, path, bits):
 if __name__ == "__main__":
     import argparse
 
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(conflict_handler="resolve")  # -h is used for the hum filter, so the help is only available with --help
     parser.add_argument("source", help="the path to the audio file that shall be normalized", type=str)
-    parser.add_argument("target", help="the path to where the normlized audio shall be saved", type=str)
-    parser.add_argument("-c", "--channel", help="the channel of the input audio file", type=int, default=1)
+    parser.add_argument("target", help="the path to where the normlized audio shall be saved (with a {channel} placeholder, each channel is saved to a separate file)", type=str)
+    parser.add_argument("-c", "--channel", help="the channel of the input audio file, a comma separated list of channels or \"all\"", type=str, default="1")
+    parser.add_argument("-i", "--independent", help="normalize and limit the channels independently instead of applying the same gain to all of them", action="store_true")
     parser.add_argument("-f", "--highpass", help="a frequency of a high pass filter", type=float, default=None)
     parser.add_argument("-h", "--humfilter", help="a frequency of hum, that shall be removed (usually 50Hz or 60Hz)", type=float, default=None)
+    parser.add_argument("-n", "--fftnotch", help="remove the hum with a single FFT based filter instead of one notch filter per harmonic", action="store_true")
     parser.add_argument("-q", "--q_factor", help="the Q-factor of the hum filtering", type=float, default=10.0)
     parser.add_argument("-l", "--level", help="the target level in db[FS]", type=float, default=-20.0)
     parser.add_argument("-p", "--headroom", help="the headroom in dB[FS] after limiting", type=float, default=-0.1)
     parser.add_argument("-r", "--resolution", help="the resolution in bits of the target file", type=int, default=16)
+    parser.add_argument("-D", "--dither", help="add triangular dither before reducing the resolution", action="store_true")
+    parser.add_argument("-R", "--samplingrate", help="the sampling rate of the target file, if the audio shall be resampled", type=float, default=None)
+    parser.add_argument("-S", "--single", help="compute with single precision (float32) instead of double precision", action="store_true")
     parser.add_argument("-s", "--smoothing", help="the smoothing time in seconds for the level normalization", type=float, default=10.0)
     parser.add_argument("-t", "--threshold", help="the level threshold in dB for the activity detection of the normalization", type=float, default=-10.0)
     parser.add_argument("-a", "--lookahead", help="the lookahead time of the limiter in seconds", type=float, default=0.025)
+    parser.add_argument("-b", "--blocksize", help="the number of samples, that are processed at once", type=int, default=2**16)
+    parser.add_argument("-d", "--decimation", help="the factor by which the sampling rate of the level computation is reduced", type=int, default=1)
+    parser.add_argument("-L", "--levelcache", help="a .npy file for caching the level, so it is reused if only the target level, headroom or limiter change", default=None)
+    parser.add_argument("-P", "--profile", help="print the time, that the processing stages take", action="store_true")
+    parser.add_argument("-M", "--memory", help="also print the peak memory consumption of the processing stages (this slows down the processing)", action="store_true")
+    parser.add_argument("-w", "--workers", help="the number of processes, that process segments of the audio in parallel", type=int, default=1)
+    parser.add_argument("-F", "--follow", help="normalize the source, while it is still being written, until it has not grown for the given number of seconds (default: 10)", type=float, nargs="?", const=10.0, default=None)
+    parser.add_argument("-C", "--checkpoint", help="the time in seconds between checkpoints, from which an interrupted run is resumed", type=float, default=None)
     args = parser.parse_args()
 
-    normalize(source=args.source,
-              target=args.target,
-              channel=args.channel,
-              highpass_frequencies=[args.highpass] if args.highpass else [],
-              notch_filter_frequencies=numpy.multiply(args.humfilter, [1, 3, 5]) if args.humfilter else [],
-              notch_filter_q_factor=args.q_factor,
-              target_level=args.level,
-              headroom=args.headroom,
-              resolution=args.resolution,
-              level_smoothing=args.smoothing,
-              level_threshold=args.threshold,
-              limiter_lookahead=args.lookahead,
-              show_progress=True)
+    channel = args.channel if args.channel == "all" else [int(c) for c in args.channel.split(",")]
+    if len(channel) == 1:
+        channel = channel[0]
+    target = args.target
+    if "{channel}" in target:
+        channels = range(1, channel_count(args.source) + 1) if channel == "all" else [channel] if isinstance(channel, int) else channel
+        target = [target.format(channel=c) for c in channels]
+    report = normalize(source=args.source,
+                       target=target,
+                       channel=channel,
+                       highpass_frequencies=[args.highpass] if args.highpass else [],
+                       notch_filter_frequencies=numpy.multiply(args.humfilter, [1, 3, 5]) if args.humfilter else [],
+                       notch_filter_q_factor=args.q_factor,
+                       target_level=args.level,
+                       headroom=args.headroom,
+                       resolution=args.resolution,
+                       level_smoothing=args.smoothing,
+                       level_threshold=args.threshold,
+                       limiter_lookahead=args.lookahead,
+                       show_progress=True,
+                       block_size=args.blocksize,
+                       workers=args.workers,
+                       level_decimation=args.decimation,
+                       dither=args.dither,
+                       level_cache=args.levelcache,
+                       link_channels=not args.independent,
+                       target_sampling_rate=args.samplingrate,
+                       dtype=numpy.float32 if args.single else numpy.float64,
+                       fft_notch_filter=args.fftnotch,
+                       profile=args.profile,
+                       profile_memory=args.memory,
+                       checkpoint_interval=args.checkpoint,
+                       follow=args.follow)
+    if report is not None:
+        print(_format_profile(report))
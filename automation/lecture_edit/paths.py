@@ -12,11 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import importlib.resources
 import os
 import pathlib
 
-__all__ = ("Path", "Paths")
+__all__ = ("Path", "Paths", "file_info")
 
 
 class Path:
@@ -63,6 +64,23 @@ class Path:
         return os.path.getmtime(self.os)
 
 
+def file_info(path, previous=None):
+    # returns the size, the modification time and the hash of a file, by which cached results, that have been
+    # computed from it, are validated. The hash is only recomputed, if the file's size or modification time
+    # differ from those of the previous info.
+    stat = os.stat(path)
+    info = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if previous is not None and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime_ns:
+        info["hash"] = previous["hash"]
+    else:
+        file_hash = hashlib.blake2b()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                file_hash.update(chunk)
+        info["hash"] = file_hash.hexdigest()
+    return info
+
+
 class Paths:
     def __init__(self, project_file):
         self.base_name = os.path.splitext(os.path.basename(project_file))[0]
@@ -92,6 +110,7 @@ class Paths:
         self.greenscreen_config = self.__file(self.intermediate_path, "greenscreen.json")
         self.merge_config = self.__file(self.intermediate_path, "merge.json")
         self.slide_transitions = self.__file(self.intermediate_path, "slide_transitions.json")
+        self.presentation_index = self.__file(self.intermediate_path, "presentation_index.json")
         self.speaker_visibility = self.__file(self.intermediate_path, "speaker_visibility.json")
         self.audio_config = self.__file(self.intermediate_path, "audio.json")
         self.rough_audio = self.__file(self.intermediate_path, "rough_audio.wav")
@@ -99,12 +118,19 @@ class Paths:
         self.lecture_presentation = self.__file(self.intermediate_path, "lecture_presentation.pptx")
         self.presentation_video = self.__file(self.intermediate_path, "lecture_presentation.mp4")
         self.lecture_audio = self.__file(self.intermediate_path, "lecture_audio.wav")
+        self.level_cache = self.__file(self.intermediate_path, "level_cache.npy")
+        self.audio_profile = self.__file(self.intermediate_path, "audio_profile.json")
+        self.waveform_path = self.__file(self.intermediate_path, "waveforms")
         # final data
         self.lecture_video = self.__file(self.final_path, f"{self.base_name}.mp4")
         self.lecture_handout = self.__file(self.final_path, f"{self.base_name}.pdf")
         # other
         self.speaker_placement = self.__resource("speaker_placement.png")
 
+    def waveform_cache(self, path):
+        # the file, in which the waveform peaks of the audio in the given file are cached
+        return self.__file(self.waveform_path, f"{os.path.basename(path.standard)}.npz")
+
     def from_blender(self, path):
         for name in dir(self):
             if not name.startswith("_"):
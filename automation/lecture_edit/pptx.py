@@ -12,226 +12,437 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import contextlib
+import json
 import logging
+import multiprocessing
 import os
 import re
+import struct
 import xml.etree.ElementTree as ET
 import zipfile
+from .paths import file_info
 
-__all__ = ("create_presentation",)
+__all__ = ("create_presentation", "PresentationIndex", "SlideInfo")
 
 _xml_namespaces = {
     "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
-    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
     "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
-    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
-    "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
 }
 
 
-def xml_find(node, path, create=False):
-    if not path:
-        return node
-    for child in node.findall(path[0], _xml_namespaces):
-        result = xml_find(child, path[1:], create=create)
-        if result is not None:
-            return result
-    if create:
-        for p in path:
-            new_node = ET.SubElement(node, p)
-            node = new_node
-        return node
-
-
-def xml_walk(node):
-    for child in node:
-        yield child
-        yield from xml_walk(child)
-
-
-def node_source(node, source):
-    tag = node.tag
-    for ns, url in _xml_namespaces.items():
-        if tag.startswith(f"{{{url}}}"):
-            tag = tag.replace(f"{{{url}}}", f"{ns}:")
-    regex = f"<{tag}\s+"
-    for name, value in node.attrib.items():
-        regex += f'{name}="{value}"\s*'
-    regex += ">"
-    match = re.search(regex, source)
-    if match:
-        return match.group(0)
-
-
-def slide_sources(path):
+def slide_infos(path):
+    """Yields a SlideInfo tuple for each slide of the presentation.
+
+    The slides are parsed with ``iterparse`` while they are decompressed, so the complete tree of a slide
+    is never built. Each element is discarded, when it has been processed, and the parsing stops after the
+    timing of the animations. This way, the memory does not depend on the size of the slides (e.g. with
+    large tables or diagrams).
+    """
     with zipfile.ZipFile(path.os) as archive:
-        slides = [
+        for slide in _slide_names(archive):
+            with archive.open(slide) as f:
+                yield _slide_info(f)
+
+
+def _slide_names(archive):
+    slides = [
+        n
+        for n in archive.namelist()
+        if n.startswith("ppt/slides") and not n.startswith("ppt/slides/_rels")
+    ]
+    slides.sort(key=lambda n: int(os.path.basename(n).lstrip("slide").rstrip(".xml")))
+    return slides
+
+
+def _slide_info(file):
+    # The title is the text of the first paragraph of the first text body of a shape and the animations are
+    # the click-triggered animations of the first sequence of the slide's timing
+    p, a = (f"{{{_xml_namespaces[n]}}}" for n in ("p", "a"))
+    body_tag, paragraph_tag, sequence_tag, time_node_tag = f"{p}txBody", f"{a}p", f"{p}seq", f"{p}cTn"
+    transition_tag, timing_tag = f"{p}transition", f"{p}timing"
+    body_path = [f"{p}cSld", f"{p}spTree", f"{p}sp"]
+    sequence_path = [timing_tag, f"{p}tnLst", f"{p}par", time_node_tag, f"{p}childTnLst"]
+    elements = []  # the open elements from the root to the current element
+    body = paragraph = sequence = None
+    in_sequence = False
+    title, title_found, title_nodes = None, False, []
+    animation_ids, transition = [], False
+    for event, element in ET.iterparse(file, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if paragraph is not None:
+                title_nodes.append(element)
+            elif body is not None and elements[-1] is body:
+                title = ""
+                if tag == paragraph_tag:
+                    paragraph = element
+            elif in_sequence:
+                if tag == time_node_tag and element.get("nodeType") == "clickEffect":
+                    animation_ids.append(element.get("id"))
+            elif tag == body_tag and not title_found and _open_path(elements) == body_path:
+                body = element
+            elif tag == sequence_tag and sequence is None and _open_path(elements) == sequence_path:
+                sequence, in_sequence = element, True
+            elif tag == transition_tag:
+                transition = True
+            elements.append(element)
+        else:
+            elements.pop()
+            if element is paragraph:
+                title = "".join(n.text for n in title_nodes if n.text is not None)
+                paragraph, title_nodes = None, []
+                body, title_found = None, True
+            elif element is body:
+                body, title_found = None, True
+            elif element is sequence:
+                in_sequence = False  # only the first sequence contains the animations
+            if elements:
+                del elements[-1][-1]
+                if tag == timing_tag and len(elements) == 1:
+                    break
+    return SlideInfo(title, len(animation_ids), animation_ids, transition)
+
+
+def _open_path(elements):
+    # the tags of the open elements below the root
+    return [e.tag for e in elements[1:]] if len(elements) <= 6 else None
+
+
+SlideInfo = collections.namedtuple("SlideInfo", ("title", "animations", "animation_ids", "transition"))
+
+
+class PresentationIndex:
+    """The titles, the click-triggered animations and the transitions of the slides of a presentation.
+
+    Collecting them requires decompressing and parsing all slides, so they are saved to an index file and
+    only collected again, when the content of the presentation has changed. ``slides`` is a list of
+    ``SlideInfo`` tuples, whose title is None for slides without a text body.
+    """
+
+    def __init__(self, presentation, path):
+        previous = None
+        if os.path.isfile(path.os):
+            with open(path.os) as f:
+                previous = json.load(f)
+        info = file_info(presentation.os, None if previous is None else previous["presentation"])
+        if previous is not None and _without_mtime(previous["presentation"]) == _without_mtime(info):
+            slides = previous["slides"]
+            save = previous["presentation"] != info  # the presentation has only been touched
+        else:
+            slides = [s._asdict() for s in slide_infos(presentation)]
+            save = True
+        if save:
+            os.makedirs(os.path.dirname(path.os), exist_ok=True)
+            with open(path.os, "w") as f:
+                json.dump({"presentation": info, "slides": slides}, f, indent=4)
+        self.slides = [SlideInfo(**s) for s in slides]
+
+
+def _without_mtime(info):
+    # the file info without the modification time, which changes, when the file is only touched
+    return {k: v for k, v in info.items() if k != "mtime"}
+
+
+def create_presentation(source_file, target_file, durations, compression_level=9, workers=1):
+    # only the changed slides are compressed with the given compression level, while the other files of
+    # the presentation (e.g. embedded videos and images) are copied without decompressing them. With more
+    # than one worker, the slides are changed in parallel processes, while the other files are copied. The
+    # changed slides are written in their original order, so the result is the same as with one process.
+    with zipfile.ZipFile(source_file.os) as source, open(source_file.os, "rb") as raw_source:
+        slides = _slide_names(source)
+        tasks = (
+            (source.read(path), slide_duration, animation_durations, path)
+            for path, (slide_duration, animation_durations) in zip(slides, durations)
+        )
+        workers = min(workers, len(slides))
+        with multiprocessing.Pool(workers) if workers > 1 else contextlib.nullcontext() as pool:
+            rewritten = map(_rewrite_slide, tasks) if pool is None else pool.imap(_rewrite_slide, tasks)
+            with zipfile.ZipFile(
+                target_file.os,
+                mode="w",
+                compression=zipfile.ZIP_DEFLATED,
+                compresslevel=compression_level,
+            ) as target:
+                slide_set = set(slides)
+                for info in source.infolist():
+                    if info.filename not in slide_set:
+                        _copy_compressed(raw_source, info, target)
+                for path, data in zip(slides, rewritten):
+                    with target.open(path, "w") as target_file:
+                        target_file.write(data)
+
+
+def _rewrite_slide(arguments):
+    source, slide_duration, animation_durations, path = arguments
+    return rewrite_slide(source.decode(), slide_duration, animation_durations, path).encode()
+
+
+def rewrite_slide(source, slide_duration, animation_durations, path=None):
+    """Changes the animations of a slide, so that they are started automatically after the given durations
+    and adds a transition to the next slide after the slide's duration.
+
+    The slide is parsed once and all changes are made in the parsed nodes, so that the effort is linear in
+    the length of the slide's XML. Only the start tags of the changed nodes are modified, so the rest of
+    the XML, including the namespace prefixes, stays exactly like PowerPoint has written it.
+    """
+    nodes = _parse_xml(source)
+    slide = next(n for n in nodes if isinstance(n, _XmlElement))
+    # change the click-triggered animations to automatically started animations and add their timings
+    seq = slide.find(["p:timing", "p:tnLst", "p:par", "p:cTn", "p:childTnLst", "p:seq"])
+    animations = []
+    if seq is not None:
+        animations = [
             n
-            for n in archive.namelist()
-            if n.startswith("ppt/slides") and not n.startswith("ppt/slides/_rels")
+            for n in seq.iter()
+            if n.tag == "p:cTn" and n.attributes.get("nodeType") in ("clickEffect", "afterEffect", "withEffect")
         ]
-        slides.sort(key=lambda n: int(os.path.basename(n).lstrip("slide").rstrip(".xml")))
-        for slide in slides:
-            with archive.open(slide) as f:
-                yield f.read().decode()
-
-
-def slide_animations(slide_xml, node_types=("clickEffect",)):
-    seq = xml_find(slide_xml, ["p:timing", "p:tnLst", "p:par", "p:cTn", "p:childTnLst", "p:seq"])
-    if seq:
-        for node in xml_walk(seq):
-            if (
-                node.tag == f"{{{_xml_namespaces['p']}}}cTn"
-                and "nodeType" in node.attrib
-                and node.attrib["nodeType"] in node_types
-            ):
-                yield node
-
-
-def dependent_animations(node, slide_xml):
-    node_found = False
-    for animation_node in slide_animations(slide_xml, node_types=("clickEffect", "afterEffect", "withEffect")):
-        if node_found:
-            if animation_node.attrib["nodeType"] == "clickEffect":
+    time_nodes = {n.attributes["id"]: n for n in slide.iter() if n.tag == "p:cTn" and "id" in n.attributes}
+    click_animations = []  # tuples of the click-triggered animation and the animations, that are started with it
+    for node in animations:
+        if node.attributes["nodeType"] == "clickEffect":
+            click_animations.append((node, []))
+        elif click_animations:
+            click_animations[-1][1].append(node)
+    cumulative_duration = 0
+    for duration, (node, dependent_nodes) in zip(animation_durations, click_animations):
+        condition = _first_condition(node)
+        if condition is None or condition.source != '<p:cond delay="0"/>':
+            logging.warning(f"the start condition of node {node.attributes['id']} not found in {path}")
+        else:
+            node.set("nodeType", "afterEffect")
+            condition.set("delay", duration)
+        # add the cumulative timing to the group of animations, that contains the node
+        group_id = str(int(node.attributes["id"]) - 1)
+        group = time_nodes.get(group_id)
+        condition = None
+        if group is not None and group.source == f'<p:cTn id="{group_id}" fill="hold">':
+            condition = _only_condition(group)
+        if condition is None or not re.fullmatch(r'<p:cond delay="\d+"/>', condition.source):
+            logging.warning(f"no cumulative timing in {path} before node {node.attributes['id']}")
+        else:
+            condition.set("delay", cumulative_duration)
+        cumulative_duration += duration
+        # change the timings of the automatically started animations
+        for dependent_node in dependent_nodes:
+            condition = _first_condition(dependent_node)
+            if condition is not None and condition.source == '<p:cond delay="0"/>':
+                condition.set("delay", duration)
+    # remove the obsolete groups of the animations, that are started with the previous animation
+    with_groups = {str(int(n.attributes["id"]) - 1) for n in animations if n.attributes["nodeType"] == "withEffect"}
+    _merge_groups(slide, "0", lambda i: i in with_groups)
+    # remove the obsolete groups inside the automatically started animations
+    _merge_groups(slide, "indefinite", lambda i: True)
+    # add a node about the beginning of the animations
+    for node in slide.iter():
+        if (
+            node.source == "<p:stCondLst>"
+            and len(node.children) == 1
+            and isinstance(node.children[0], _XmlElement)
+            and node.children[0].source == '<p:cond delay="indefinite"/>'
+        ):
+            node.children.extend(_parse_xml('<p:cond evt="onBegin" delay="0"><p:tn val="2"/></p:cond>'))
+    # fix the numeration of the animation ids
+    for i, node in enumerate((n for n in slide.iter() if re.match(r'<p:cTn id="\d+"', n.source)), start=1):
+        if node.attributes["id"] != str(i):
+            node.set("id", i)
+    # add the timing for the slide transition
+    if any(n.tag == "p:transition" for n in slide.iter()):
+        logging.info(f"slide transition is already defined in {path}")
+    addition = _parse_xml(
+        f'<mc:AlternateContent xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006">'
+        f'<mc:Choice xmlns:p14="http://schemas.microsoft.com/office/powerpoint/2010/main" Requires="p14">'
+        f'<p:transition spd="slow" p14:dur="2000" advTm="{slide_duration}" />'
+        f"</mc:Choice>"
+        f"<mc:Fallback>"
+        f'<p:transition spd="slow" advTm="{slide_duration}" />'
+        f"</mc:Fallback>"
+        f"</mc:AlternateContent>"
+    )
+    timing = [i for i, n in enumerate(slide.children) if isinstance(n, _XmlElement) and n.source == "<p:timing>"]
+    position = timing[-1] if animation_durations and timing else len(slide.children)
+    slide.children[position:position] = addition
+    return _serialize_xml(nodes)
+
+
+def _copy_compressed(source, info, target):
+    # Copies the compressed data of an entry of the source archive to the target archive, so that it is
+    # neither decompressed nor compressed again. zipfile has no function for this, so the entry is written
+    # like ZipFile.writestr writes it, except that the data is not passed through a compressor.
+    source.seek(info.header_offset)
+    *_, name_length, extra_length = struct.unpack(zipfile.structFileHeader, source.read(zipfile.sizeFileHeader))
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+    data = source.read(info.compress_size)
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.compress_type = info.compress_type
+    copy.CRC = info.CRC
+    copy.compress_size = info.compress_size
+    copy.file_size = info.file_size
+    copy.create_system = info.create_system
+    copy.external_attr = info.external_attr
+    copy.flag_bits = info.flag_bits & ~0x08  # the sizes are stored in the header instead of a data descriptor
+    target.fp.seek(target.start_dir)
+    copy.header_offset = target.fp.tell()
+    target.fp.write(copy.FileHeader())
+    target.fp.write(data)
+    target.start_dir = target.fp.tell()
+    target.filelist.append(copy)
+    target.NameToInfo[copy.filename] = copy
+    target._didModify = True
+
+
+class _XmlElement:
+    """An element of a slide's XML, that can be changed without changing the rest of the XML.
+
+    ElementTree does not preserve the namespace prefixes and declarations, on which PowerPoint relies,
+    so the slides are parsed into these elements instead, when they are changed. ``source`` is the start
+    tag, in which only the values of the changed attributes are replaced, and the children are elements
+    or strings with the text between them.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.tag = re.match(r"<([^\s/>]+)", source).group(1)
+        self.attributes = {n: a if b is None else b for n, a, b in _xml_attribute.findall(source)}
+        self.empty = source.endswith("/>")
+        self.children = []
+        self.end = ""
+
+    def set(self, name, value):
+        value = str(value)
+        self.attributes[name] = value
+        pattern = rf"""(\s{re.escape(name)}\s*=\s*)(?:"[^"]*"|'[^']*')"""
+        self.source = re.sub(pattern, lambda m: f'{m.group(1)}"{value}"', self.source, count=1)
+
+    def find(self, path):
+        # returns the first element, that can be reached with the path of tags, which are searched depth first
+        if not path:
+            return self
+        for child in self.children:
+            if isinstance(child, _XmlElement) and child.tag == path[0]:
+                result = child.find(path[1:])
+                if result is not None:
+                    return result
+
+    def iter(self):
+        # yields all elements below this element in the order of the XML
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, _XmlElement):
+                    yield child
+                    stack.append(iter(child.children))
+                    break
+            else:
+                stack.pop()
+
+
+_xml_token = re.compile(r"""<(?:[^>"']|"[^"]*"|'[^']*')*>|[^<]+""")
+_xml_attribute = re.compile(r"""([^\s=<]+)\s*=\s*(?:'([^']*)'|"([^"]*)")""")
+
+
+def _parse_xml(source):
+    # returns the list of the top level nodes of the XML
+    nodes = []
+    stack = []
+    for token in _xml_token.findall(source):
+        siblings = stack[-1].children if stack else nodes
+        if token.startswith("</"):
+            stack.pop().end = token
+        elif token.startswith("<") and not token.startswith(("<?", "<!")):
+            element = _XmlElement(token)
+            siblings.append(element)
+            if not element.empty:
+                stack.append(element)
+        else:
+            siblings.append(token)
+    return nodes
+
+
+def _serialize_xml(nodes):
+    parts = []
+    stack = [(iter(nodes), "")]
+    while stack:
+        for node in stack[-1][0]:
+            if isinstance(node, _XmlElement):
+                parts.append(node.source)
+                stack.append((iter(node.children), node.end))
                 break
+            parts.append(node)
+        else:
+            parts.append(stack.pop()[1])
+    return "".join(parts)
+
+
+def _first_condition(node):
+    # returns the first p:cond element of the p:stCondLst, with which the node begins
+    conditions = node.children[0] if node.children and isinstance(node.children[0], _XmlElement) else None
+    if conditions is not None and conditions.source == "<p:stCondLst>" and conditions.children:
+        condition = conditions.children[0]
+        if isinstance(condition, _XmlElement) and condition.tag == "p:cond":
+            return condition
+
+
+def _only_condition(node):
+    # returns the p:cond element, if it is the only one in the p:stCondLst, with which the node begins
+    condition = _first_condition(node)
+    if condition is not None and len(node.children[0].children) == 1:
+        return condition
+
+
+def _merge_groups(slide, delay, predicate):
+    # Merges each group of animations (a p:par element with a p:cTn, that contains the start condition with
+    # the given delay and a p:childTnLst), for whose id the predicate is true, into the group before it, by
+    # moving its animations to the p:childTnLst of the previous group.
+    stack = [slide]
+    while stack:
+        parent = stack.pop()
+        children = []
+        previous = None
+        for child in parent.children:
+            if _is_group(previous) and _starts_group(child, delay, predicate):
+                group, merged = children[-1].children[-1], child.children[0]
+                group.children[-1].children.extend(merged.children[1].children)
+                group.children.extend(merged.children[2:])
+                children[-1].children.extend(child.children[1:])
             else:
-                yield animation_node
-        elif animation_node.attrib["id"] == node.attrib["id"]:
-            node_found = True
-
-
-def slide_xmls(path):
-    for s in slide_sources(path):
-        yield ET.fromstring(s)
-
-
-def create_presentation(source_file, target_file, durations):
-    with zipfile.ZipFile(source_file.os) as source:
-        with zipfile.ZipFile(
-            target_file.os,
-            mode="w",
-            compression=zipfile.ZIP_DEFLATED,
-            compresslevel=9,
-        ) as target:
-            slides = []
-            for path in source.namelist():
-                if path.startswith("ppt/slides") and not path.startswith("ppt/slides/_rels"):
-                    slides.append(path)
-                else:
-                    data = source.read(path)
-                    target.writestr(path, data)
-            slides.sort(key=lambda n: int(os.path.basename(n).lstrip("slide").rstrip(".xml")))
-            for path, original, (slide_duration, animation_durations) in zip(
-                slides, slide_sources(source_file), durations
-            ):
-                with target.open(path, "w") as target_file:
-                    # add the timings for the animations
-                    modified = original
-                    slide_xml = ET.fromstring(original)
-                    cumulative_duration = 0
-                    for duration, node in zip(animation_durations, slide_animations(slide_xml)):
-                        # change the node from click-triggered to automatically started
-                        node_sourcecode = node_source(node, modified)
-                        modified_node_source = node_sourcecode.replace(node.attrib["nodeType"], "afterEffect")
-                        # add the timing
-                        old = f'{node_sourcecode}<p:stCondLst><p:cond delay="0"/>'
-                        new = f'{modified_node_source}<p:stCondLst><p:cond delay="{duration}"/>'
-                        if old not in modified:
-                            print(f"{old} not found in {path}")
-                        modified = modified.replace(old, new)
-                        # add the cumulative timing before the node
-                        old = (
-                            f'<p:cTn id="{int(node.attrib["id"]) - 1}" fill="hold">'
-                            f"<p:stCondLst>"
-                            f'<p:cond delay="\d+"/>'
-                            f"</p:stCondLst>"
-                        )
-                        new = (
-                            f'<p:cTn id="{int(node.attrib["id"]) - 1}" fill="hold">'
-                            f"<p:stCondLst>"
-                            f'<p:cond delay="{cumulative_duration}"/>'
-                            f"</p:stCondLst>"
-                        )
-                        to_replace = re.findall(old, modified)
-                        if not to_replace:
-                            print(f"{len(to_replace)} cumulative timings in {path} before  node {node.attrib['id']}")
-                        for match in to_replace:
-                            modified = modified.replace(match, new)
-                        if new not in modified:
-                            print(path, node.attrib["id"], old in modified)
-                            print(match)
-                            print(new)
-                        cumulative_duration += duration
-                        # change the timings of the automatically started animations
-                        for dependent_node in dependent_animations(node, slide_xml):
-                            node_sourcecode = node_source(dependent_node, modified)
-                            old = f'{node_sourcecode}<p:stCondLst><p:cond delay="0"/>'
-                            new = f'{node_sourcecode}<p:stCondLst><p:cond delay="{duration}"/>'
-                            modified = modified.replace(old, new)
-                    # remove obsolete nodes the automatically started animations
-                    for node in slide_animations(ET.fromstring(modified), node_types=("withEffect",)):
-                        to_remove = (
-                            f"</p:childTnLst>"
-                            f"</p:cTn>"
-                            f"</p:par>"
-                            f"<p:par>"
-                            f'<p:cTn id="{int(node.attrib["id"]) - 1}" fill="hold">'
-                            f"<p:stCondLst>"
-                            f'<p:cond delay="0"/>'
-                            f"</p:stCondLst>"
-                            f"<p:childTnLst>"
-                        )
-                        modified = modified.replace(to_remove, "")
-                    # remove obsolete nodes inside the automatically started animations
-                    regex = (
-                        "</p:childTnLst>"
-                        "</p:cTn>"
-                        "</p:par>"
-                        "<p:par>"
-                        '<p:cTn id="\d+" fill="hold">'
-                        "<p:stCondLst>"
-                        '<p:cond delay="indefinite"/>'
-                        "</p:stCondLst>"
-                        "<p:childTnLst>"
-                    )
-                    to_remove = re.findall(regex, modified)
-                    # if not to_remove:
-                    #     print(f"no obsolete nodes in {path}")
-                    for match in to_remove:
-                        modified = modified.replace(match, "")
-                    # add a node about the beginning of the animations
-                    old = '<p:stCondLst><p:cond delay="indefinite"/></p:stCondLst>'
-                    new = (
-                        "<p:stCondLst>"
-                        '<p:cond delay="indefinite"/>'
-                        '<p:cond evt="onBegin" delay="0">'
-                        '<p:tn val="2"/>'
-                        "</p:cond>"
-                        "</p:stCondLst>"
-                    )
-                    modified = modified.replace(old, new)
-                    # fix the numeration of the animation ids
-                    for i, match in enumerate(re.findall(r'<p:cTn id="\d+"', modified), start=1):
-                        new = f'<p:cTn id="{i}"'
-                        if match != new:
-                            modified = modified.replace(match, new)
-                    # add the timing for the slide transition
-                    if "<p:transition " in modified:
-                        logging.info(f"slide transition is already defined in {path}")
-                    addition = (
-                        f'<mc:AlternateContent xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006">'
-                        f'<mc:Choice xmlns:p14="http://schemas.microsoft.com/office/powerpoint/2010/main" Requires="p14">'
-                        f'<p:transition spd="slow" p14:dur="2000" advTm="{slide_duration}" />'
-                        f"</mc:Choice>"
-                        f"<mc:Fallback>"
-                        f'<p:transition spd="slow" advTm="{slide_duration}" />'
-                        f"</mc:Fallback>"
-                        f"</mc:AlternateContent>"
-                    )
-                    if animation_durations:
-                        delimiter = "<p:timing>"
-                    else:
-                        delimiter = "</p:sld>"
-                    split = modified.split(delimiter)
-                    modified = delimiter.join(split[0:-1]) + addition + delimiter + delimiter.join(split[-1:])
-                    target_file.write(modified.encode())
+                children.append(child)
+            previous = child
+        parent.children = children
+        stack.extend(c for c in reversed(children) if isinstance(c, _XmlElement))
+
+
+def _is_group(node):
+    # whether the node is a p:par element, whose XML ends with the end of a p:cTn element with a p:childTnLst
+    return (
+        isinstance(node, _XmlElement)
+        and node.tag == "p:par"
+        and node.children
+        and isinstance(node.children[-1], _XmlElement)
+        and node.children[-1].tag == "p:cTn"
+        and node.children[-1].children
+        and isinstance(node.children[-1].children[-1], _XmlElement)
+        and node.children[-1].children[-1].tag == "p:childTnLst"
+        and not node.children[-1].children[-1].empty
+    )
+
+
+def _starts_group(node, delay, predicate):
+    # whether the node is a p:par element, that begins with a p:cTn with the given delay and a p:childTnLst
+    if not (isinstance(node, _XmlElement) and node.source == "<p:par>" and node.children):
+        return False
+    time_node = node.children[0]
+    if not isinstance(time_node, _XmlElement):
+        return False
+    match = re.fullmatch(r'<p:cTn id="(\d+)" fill="hold">', time_node.source)
+    if match is None or not predicate(match.group(1)):
+        return False
+    condition = _only_condition(time_node)
+    return (
+        condition is not None
+        and condition.source == f'<p:cond delay="{delay}"/>'
+        and len(time_node.children) > 1
+        and isinstance(time_node.children[1], _XmlElement)
+        and time_node.children[1].source == "<p:childTnLst>"
+    )
@@ -0,0 +1,175 @@
+# Copyright 2020-2021 Jonas Schulte-Coerne and the CYSTINET-Africa project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Assembles the rough audio track from the cuts of the Cut scene without Blender. The result is the same as
+# that of Blender's audio mixdown of the Cut scene, except for the short crossfades at the cuts, which
+# avoid clicks, when the waveform does not continue smoothly across a cut. Run it from the automation
+# directory with
+#     python -m lecture_edit.rough_audio <the project's .blend file>
+
+import math
+import numpy
+from . import normalization
+
+__all__ = ("assemble",)
+
+
+def assemble(cuts, target, fps, crossfade=0.01, resolution=24, block_size=2**16):
+    # cuts maps the paths of the source files to lists of (offset, start, end) tuples in frames, like
+    # Config.cuts returns them. The missing values are filled in the same way as sequences.ensure_audio_strips
+    # does it, which is why the dictionary has to be ordered like the sorted paths there. The crossfade is
+    # the length of the crossfades in seconds. Returns the number of frames of the target file.
+    sources = {}
+    for path in cuts:
+        sampling_rate = next(iter(sources.values())).sampling_rate if sources else None
+        sources[path] = _Source(path, sampling_rate, block_size)
+    if not sources:
+        raise ValueError("Assembling the rough audio track requires at least one source file.")
+    sampling_rate = next(iter(sources.values())).sampling_rate
+    channels = {s.channels for s in sources.values()}
+    if len(channels) > 1:
+        raise ValueError("Assembling the rough audio track requires all source files to have the same number of channels.")
+    strips = _strips(cuts, sources, fps)
+    # Blender mixes the Cut scene down from its first frame (1) to its last frame, which setup_cut_scene sets
+    # to the end of the last strip, but at least to 250
+    length = _sample(max([250] + [end - 1 for _, end, _, _ in strips]), sampling_rate, fps)
+    half = int(round(crossfade * sampling_rate / 2))
+    stream = _mix(_contributions(strips, sources, sampling_rate, fps, half, length), length, channels.pop(), block_size)
+    return normalization.write(stream, sampling_rate, path=target, bits=resolution)
+
+
+class _Source:
+    """Reads ranges of samples from a source file.
+
+    As long as the ranges are requested in ascending order, the file is read in a single pass, which also
+    means, that a compressed file is only decoded once. Samples outside the file are returned as silence.
+    """
+
+    def __init__(self, path, sampling_rate, block_size):
+        _, self.sampling_rate, self.length = normalization.read(path, channel="all", sampling_rate=sampling_rate)
+        if sampling_rate is not None and int(round(self.sampling_rate)) != int(round(sampling_rate)):
+            raise ValueError(f"Cannot assemble the rough audio track, because {path} has a sampling rate of {self.sampling_rate:g}Hz instead of {sampling_rate:g}Hz.")
+        self.channels = normalization.channel_count(path)
+        self.__path = path
+        self.__block_size = block_size
+        self.__stream = None
+        self.__position = 0
+        self.__rest = None
+
+    def read(self, start, stop):
+        # yields blocks with the samples from start to stop, which is padded with silence outside the file
+        first, last = min(max(start, 0), self.length), min(max(stop, 0), self.length)
+        if start < first:
+            yield numpy.zeros((min(first, stop) - start, self.channels))
+        if first < last:
+            if self.__stream is None or first < self.__position:
+                self.__stream, _, _ = normalization.read(self.__path, channel="all", block_size=self.__block_size, start=first, sampling_rate=self.sampling_rate)
+                self.__position, self.__rest = first, None
+            while self.__position < last:
+                block = self.__rest if self.__rest is not None else next(self.__stream)
+                self.__rest = None
+                begin, end = max(first - self.__position, 0), min(last - self.__position, len(block))
+                if end < len(block):
+                    self.__rest = block[end:]
+                if begin < end:
+                    yield block[begin:end]
+                self.__position += end
+        if last < stop:
+            yield numpy.zeros((stop - max(last, start), self.channels))
+
+
+def _sample(frame, sampling_rate, fps):
+    # converts a frame number to the index of the sample, at which the frame begins
+    return int(round(frame * sampling_rate / fps))
+
+
+def _strips(cuts, sources, fps):
+    # returns the (start, end, offset, path) tuples of the strips in the order of their start frames
+    strips = []
+    frame = 0
+    for path, path_cuts in cuts.items():
+        for offset, start, end in path_cuts:
+            if start is None:
+                start = frame
+            if end is None:
+                end = start + int(round(sources[path].length / sources[path].sampling_rate * fps))
+            if offset is None:
+                offset = start
+            strips.append((start, end, offset, path))
+            frame = end
+    return sorted(strips, key=lambda s: s[0])
+
+
+def _contributions(strips, sources, sampling_rate, fps, half, length):
+    # Yields tuples with the position in the target file and a block of samples, that shall be added there,
+    # sorted by the position. Each strip is faded in over the crossfade length around its start and faded
+    # out around its end. The fades of adjacent strips cover the same samples and add up to one, so the
+    # audio is crossfaded between them. The fade out is yielded as a separate block, because the
+    # contributions of the following strip can begin there.
+    fade = 0.5 - 0.5 * numpy.cos(math.pi * (numpy.arange(2 * half) + 0.5) / (2 * half))
+    for start, end, offset, path in strips:
+        start, end = (_sample(f - 1, sampling_rate, fps) for f in (start, end))
+        # the index of the sample in the target file, at which the source file begins
+        shift = _sample(offset - 1, sampling_rate, fps)
+        first, last = max(start - half, 0), min(end + half, length)
+        if end <= start or last <= first:
+            continue
+        for begin, stop in ((first, max(min(end - half, last), first)), (max(min(end - half, last), first), last)):
+            position = begin
+            for block in sources[path].read(begin - shift, stop - shift):
+                positions = numpy.arange(position, position + len(block))
+                gain = numpy.ones(len(block))
+                fading_in = positions < start + half
+                gain[fading_in] *= fade[positions[fading_in] - (start - half)]
+                fading_out = positions >= end - half
+                gain[fading_out] *= 1.0 - fade[positions[fading_out] - (end - half)]
+                yield position, block * gain[:, numpy.newaxis]
+                position += len(block)
+
+
+def _mix(contributions, length, channels, block_size):
+    # adds up the contributions and yields the blocks of the target file. Since the contributions are sorted
+    # by their position, all samples before the position of a contribution are complete.
+    buffer = numpy.zeros((0, channels))
+    start = 0  # the position of the buffer in the target file
+    for position, block in contributions:
+        while start < position:
+            count = min(len(buffer), position - start) if len(buffer) else min(block_size, position - start)
+            yield buffer[0:count] if len(buffer) else numpy.zeros((count, channels))
+            buffer = buffer[count:]
+            start += count
+        end = position + len(block)
+        if end - start > len(buffer):
+            buffer = numpy.concatenate((buffer, numpy.zeros((end - start - len(buffer), channels))))
+        buffer[position-start:end-start] += block
+    if len(buffer):
+        yield buffer
+        start += len(buffer)
+    for position in range(start, length, block_size):
+        yield numpy.zeros((min(block_size, length - position), channels))
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from .config import Config
+    from .external import assemble_rough_audio
+    from .paths import Paths
+
+    parser = argparse.ArgumentParser(description="Assembles the rough audio track of a lecture project from the cuts of its Cut scene.")
+    parser.add_argument("project", help="the project's .blend file")
+    args = parser.parse_args()
+
+    paths = Paths(os.path.abspath(args.project))
+    assemble_rough_audio(paths, Config(paths))
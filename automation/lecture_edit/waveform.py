@@ -0,0 +1,155 @@
+# Copyright 2020-2021 Jonas Schulte-Coerne and the CYSTINET-Africa project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Caches the waveforms of the audio files of a project, so that they can be displayed without decoding the
+# audio again. For each file, the minima and maxima of the samples are stored for buckets of consecutive
+# samples at several zoom levels. Run it from the automation directory with
+#     python -m lecture_edit.waveform <the project's .blend file>
+
+import json
+import os
+import numpy
+from . import normalization
+from .paths import file_info
+
+__all__ = ("Peaks", "compute", "ensure")
+
+
+def ensure(source, target, bucket_size=256, factor=4, block_size=2**16):
+    # computes the waveform peaks of the source file, unless the target file already contains the peaks of
+    # the current version of the source file. Returns True, if the peaks have been computed.
+    metadata_path = _metadata_path(target)
+    previous = None
+    if os.path.isfile(metadata_path):
+        with open(metadata_path) as f:
+            previous = json.load(f)
+    metadata = {
+        "source": file_info(source, None if previous is None else previous.get("source")),
+        "bucket_size": bucket_size,
+        "factor": factor,
+    }
+    if previous is not None and os.path.isfile(target) and _content(metadata) == _content(previous):
+        if metadata != previous:  # the file has been touched without changing it, so the hash is not recomputed next time
+            _save_metadata(metadata_path, metadata)
+        return False
+    # the metadata is only saved after the peaks, so an interrupted run does not leave an invalid cache
+    if previous is not None:
+        os.remove(metadata_path)
+    compute(source, target, bucket_size, factor, block_size)
+    _save_metadata(metadata_path, metadata)
+    return True
+
+
+def compute(source, target, bucket_size=256, factor=4, block_size=2**16):
+    # Computes the minima and maxima of all channels in buckets of bucket_size samples in a single pass over
+    # the source file. Each following level of the pyramid combines factor buckets of the previous level,
+    # until a level has no more than factor buckets. The peaks are stored as 16 bit integers, which are
+    # rounded outwards, so that the stored envelope always contains the waveform.
+    stream, sampling_rate, length = normalization.read(source, channel="all", block_size=block_size)
+    minima, maxima = [], []
+    rest_minima = rest_maxima = numpy.zeros(0)
+    for block in stream:
+        block_minima = numpy.concatenate((rest_minima, block.min(axis=1)))
+        block_maxima = numpy.concatenate((rest_maxima, block.max(axis=1)))
+        complete = len(block_minima) // bucket_size * bucket_size
+        minima.append(block_minima[0:complete].reshape(-1, bucket_size).min(axis=1))
+        maxima.append(block_maxima[0:complete].reshape(-1, bucket_size).max(axis=1))
+        rest_minima, rest_maxima = block_minima[complete:], block_maxima[complete:]
+    if len(rest_minima):
+        minima.append(rest_minima.min(keepdims=True))
+        maxima.append(rest_maxima.max(keepdims=True))
+    peaks = numpy.empty((sum(len(m) for m in minima), 2), dtype=numpy.int16)
+    if len(peaks):
+        peaks[:, 0] = numpy.clip(numpy.floor(numpy.concatenate(minima) * 32767), -32768, 32767)
+        peaks[:, 1] = numpy.clip(numpy.ceil(numpy.concatenate(maxima) * 32767), -32768, 32767)
+    levels = [peaks]
+    while len(levels[-1]) > factor:
+        indices = numpy.arange(0, len(levels[-1]), factor)
+        levels.append(numpy.stack((numpy.minimum.reduceat(levels[-1][:, 0], indices),
+                                   numpy.maximum.reduceat(levels[-1][:, 1], indices)), axis=1))
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    with open(f"{target}.part", "wb") as f:
+        numpy.savez_compressed(f, sampling_rate=sampling_rate, length=length, bucket_size=bucket_size, factor=factor,
+                               **{f"level{i}": level for i, level in enumerate(levels)})
+    os.replace(f"{target}.part", target)
+
+
+class Peaks:
+    """The waveform peaks of an audio file, that have been computed with ``compute``.
+
+    ``levels`` is a list of arrays with the shape (buckets, 2), whose columns are the minima and maxima of
+    the buckets as 16 bit integers. The buckets of the first level have ``bucket_size`` samples and those of
+    each following level combine ``factor`` buckets of the previous one.
+    """
+
+    def __init__(self, path):
+        with numpy.load(path) as data:
+            self.sampling_rate = float(data["sampling_rate"])
+            self.length = int(data["length"])
+            self.bucket_size = int(data["bucket_size"])
+            self.factor = int(data["factor"])
+            self.levels = []
+            while f"level{len(self.levels)}" in data:
+                self.levels.append(data[f"level{len(self.levels)}"])
+
+    def envelope(self, start, stop, count):
+        # Returns the minima and maxima of count equally sized ranges of the samples from start to stop as
+        # floating point numbers between -1 and 1. They are taken from the coarsest level, whose buckets are
+        # not larger than the ranges, so that the effort does not depend on the length of the file.
+        size = (stop - start) / count
+        level, bucket_size = 0, self.bucket_size
+        while level + 1 < len(self.levels) and bucket_size * self.factor <= size:
+            level, bucket_size = level + 1, bucket_size * self.factor
+        peaks = self.levels[level]
+        minima, maxima = numpy.zeros(count), numpy.zeros(count)
+        if len(peaks) == 0:
+            return minima, maxima
+        edges = start + numpy.arange(count + 1) * size
+        indices = numpy.clip(numpy.floor(edges / bucket_size).astype(numpy.int64), 0, len(peaks) - 1)
+        indices[-1] = len(peaks)
+        # reduceat reduces the buckets from each index to the next one, or takes the bucket at the index, if
+        # a range is smaller than a bucket. The appended row makes the last index valid.
+        padded = numpy.concatenate((peaks, numpy.zeros((1, 2), dtype=peaks.dtype)))
+        inside = (edges[1:] > 0) & (edges[:-1] < self.length)
+        minima[inside] = numpy.minimum.reduceat(padded[:, 0], indices)[0:count][inside] / 32767
+        maxima[inside] = numpy.maximum.reduceat(padded[:, 1], indices)[0:count][inside] / 32767
+        return minima, maxima
+
+
+def _metadata_path(target):
+    return os.path.splitext(target)[0] + ".json"
+
+
+def _save_metadata(path, metadata):
+    with open(path, "w") as f:
+        json.dump(metadata, f, indent=4)
+
+
+def _content(metadata):
+    # the metadata without the modification time of the source file, which changes, when it is only touched
+    return dict(metadata, source={k: v for k, v in metadata["source"].items() if k != "mtime"})
+
+
+if __name__ == "__main__":
+    import argparse
+    from .config import Config
+    from .external import ensure_waveforms
+    from .paths import Paths
+
+    parser = argparse.ArgumentParser(description="Caches the waveforms of the audio files of a lecture project.")
+    parser.add_argument("project", help="the project's .blend file")
+    args = parser.parse_args()
+
+    paths = Paths(os.path.abspath(args.project))
+    ensure_waveforms(paths, Config(paths))
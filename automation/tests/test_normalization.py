@@ -0,0 +1,183 @@
+# Copyright 2020-2021 Jonas Schulte-Coerne and the CYSTINET-Africa project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Run the tests from the automation directory with
+#     python -m pytest tests
+
+import struct
+import threading
+import time
+import numpy
+import pytest
+from lecture_edit import normalization
+
+
+@pytest.mark.parametrize("channels", [None, 2])
+@pytest.mark.parametrize("link", [True, False])
+@pytest.mark.parametrize("block_size", [1, 7, 480, 4096, 40000])
+def test_limiter_keeps_the_headroom(channels, link, block_size):
+    # noise with peaks of up to 30 times the clipping level, also at the beginning and the end of the signal
+    random = numpy.random.default_rng(0)
+    signal = random.standard_normal((40000,) if channels is None else (40000, channels)) * 0.3
+    signal[random.integers(0, len(signal), 200)] *= 30.0
+    signal[1000:1010] = 25.0
+    signal[0] = 20.0
+    signal[-3:] = -30.0
+    headroom = -0.1
+    blocks = (signal[i:i+block_size] for i in range(0, len(signal), block_size))
+    limited = numpy.concatenate(list(normalization.limiter(blocks, 8000, clip=headroom, lookahead=0.025, hold=0.0125, link=link)))
+    assert limited.shape == signal.shape
+    assert numpy.abs(limited).max() <= 10 ** (headroom / 20)
+
+
+def test_parallel_processing_matches_the_serial_processing(tmp_path):
+    # speech-like noise, whose level changes every second, with a few peaks, that the limiter has to catch
+    sampling_rate = 8000
+    length = 40 * sampling_rate
+    random = numpy.random.default_rng(1)
+    time = numpy.arange(length) / sampling_rate
+    envelope = (0.5 + 0.5 * numpy.sin(2 * numpy.pi * 0.7 * time)) * numpy.repeat(random.uniform(0.05, 1.0, 40), sampling_rate)
+    signal = random.standard_normal(length) * 0.1 * envelope
+    signal[random.integers(0, length, 20)] = 0.99
+    source = str(tmp_path / "source.wav")
+    normalization.write(iter([signal]), sampling_rate, path=source, bits=24)
+    settings = dict(channel=1, highpass_frequencies=[100.0], notch_filter_frequencies=[50.0], notch_filter_q_factor=10,
+                    target_level=-20.0, headroom=-0.1, resolution=32, level_smoothing=1.0, level_threshold=-10.0,
+                    limiter_lookahead=0.025, show_progress=False)
+    normalization.normalize(source, str(tmp_path / "serial.wav"), **settings)
+    normalization.normalize(source, str(tmp_path / "parallel.wav"), workers=3, **settings)
+    serial, parallel = (numpy.concatenate(list(normalization.read(str(tmp_path / f"{n}.wav"), channel=1)[0])) for n in ("serial", "parallel"))
+    assert len(serial) == len(parallel) == length
+    # the segments begin after 13.33s and 26.67s. A deviation of -80dB from the serial result is inaudible
+    deviation = numpy.abs(parallel - serial)
+    for seam in (length // 3, 2 * length // 3):
+        assert deviation[seam-sampling_rate:seam+sampling_rate].max() < 1e-4
+    assert deviation.max() < 1e-4
+
+
+def test_silence_does_not_mute_the_following_audio(tmp_path):
+    # the envelopes decay towards zero in digital silence (e.g. in the gaps between the cuts), which must
+    # neither lead to invalid values nor to silence after the gap
+    sampling_rate = 48000
+    random = numpy.random.default_rng(2)
+    noise = [random.standard_normal(3 * sampling_rate) * 0.1 for _ in range(2)]
+    signal = numpy.concatenate((noise[0], numpy.zeros(2 * sampling_rate), noise[1]))
+    source = str(tmp_path / "source.wav")
+    normalization.write(iter([signal]), sampling_rate, path=source, bits=24)
+    headroom = -0.1
+    normalization.normalize(source, str(tmp_path / "target.wav"), channel=1, highpass_frequencies=[100.0],
+                            notch_filter_frequencies=[], notch_filter_q_factor=10, target_level=-20.0,
+                            headroom=headroom, resolution=32, level_smoothing=10.0, level_threshold=-10.0,
+                            limiter_lookahead=0.025, show_progress=False)
+    result = numpy.concatenate(list(normalization.read(str(tmp_path / "target.wav"), channel=1)[0]))
+    assert len(result) == len(signal)
+    assert numpy.isfinite(result).all()
+    assert numpy.abs(result).max() <= 10 ** (headroom / 20)
+    after = result[6*sampling_rate:]
+    assert 0.03 < numpy.sqrt(numpy.mean(numpy.square(after))) < 0.3
+
+
+def _speech_like(sampling_rate, seconds, channels, seed):
+    # noise, whose level changes every second
+    random = numpy.random.default_rng(seed)
+    levels = numpy.repeat(random.uniform(0.02, 0.3, (seconds, channels)), sampling_rate, axis=0)
+    return random.standard_normal((seconds * sampling_rate, channels)) * levels
+
+
+@pytest.mark.parametrize("finalize", [True, False])
+def test_following_a_growing_file_matches_the_finished_file(tmp_path, monkeypatch, finalize):
+    # a simulated recorder writes a wav file in chunks with a size of zero in its header, which is only
+    # updated at the end, if the recorder finalizes the file. Otherwise, the end is detected by the timeout
+    monkeypatch.setattr(normalization, "_follow_interval", 0.02)
+    sampling_rate, channels = 8000, 2
+    finished = str(tmp_path / "finished.wav")
+    normalization.write(iter([_speech_like(sampling_rate, 6, channels, seed=3)]), sampling_rate, path=finished, bits=16)
+    with open(finished, "rb") as f:
+        data = f.read()
+    layout = normalization._wav_layout(finished)
+    header, samples = bytearray(data[0:layout.offset]), data[layout.offset:]
+    header[4:8] = struct.pack("<I", layout.offset - 8)
+    header[layout.offset-4:layout.offset] = struct.pack("<I", 0)
+    growing = str(tmp_path / "growing.wav")
+
+    def record():
+        with open(growing, "wb") as f:
+            f.write(header)
+            f.flush()
+            chunk = sampling_rate // 4 * layout.block_align
+            for i in range(0, len(samples), chunk):
+                time.sleep(0.02)
+                f.write(samples[i:i+chunk])
+                f.flush()
+            if finalize:
+                f.seek(4)
+                f.write(struct.pack("<I", layout.offset - 8 + len(samples)))
+                f.seek(layout.offset - 4)
+                f.write(struct.pack("<I", len(samples)))
+
+    settings = dict(channel="all", highpass_frequencies=[100.0], notch_filter_frequencies=[50.0], notch_filter_q_factor=10,
+                    target_level=-20.0, headroom=-0.1, resolution=16, level_smoothing=1.0, level_threshold=-10.0,
+                    limiter_lookahead=0.025, show_progress=False, block_size=2**11)
+    normalization.normalize(finished, str(tmp_path / "reference.wav"), **settings)
+    recorder = threading.Thread(target=record)
+    recorder.start()
+    try:
+        normalization.normalize(growing, str(tmp_path / "followed.wav"), follow=30.0 if finalize else 0.5, **settings)
+    finally:
+        recorder.join()
+    with open(tmp_path / "reference.wav", "rb") as reference, open(tmp_path / "followed.wav", "rb") as followed:
+        assert followed.read() == reference.read()
+
+
+class _Interruption(Exception):
+    pass
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    dict(channel="all", link_channels=False, dither=True, level_decimation=4, fft_notch_filter=True, target_sampling_rate=11025),
+    dict(dtype=numpy.float32),
+], ids=["default", "dither-decimation-fft-independent-resampling", "float32"])
+def test_resumed_normalization_matches_an_uninterrupted_one(tmp_path, monkeypatch, options):
+    sampling_rate = 8000
+    source = str(tmp_path / "source.wav")
+    normalization.write(iter([_speech_like(sampling_rate, 20, 2, seed=4)]), sampling_rate, path=source, bits=24)
+    settings = dict(dict(channel=1, highpass_frequencies=[100.0], notch_filter_frequencies=[50.0], notch_filter_q_factor=10,
+                         target_level=-20.0, headroom=-0.1, resolution=24, level_smoothing=1.0, level_threshold=-10.0,
+                         limiter_lookahead=0.025, show_progress=False, block_size=2**12), **options)
+    # the run is interrupted twice by an error in the writing of a block and resumed from the checkpoint,
+    # which is saved after each block
+    written, interruptions = [], []
+    original_write = normalization._Writer.write
+
+    def write(self, block):
+        written.append(len(block))
+        if len(written) in interruptions:
+            raise _Interruption()
+        original_write(self, block)
+
+    monkeypatch.setattr(normalization._Writer, "write", write)
+    normalization.normalize(source, str(tmp_path / "reference.wav"), **settings)
+    blocks = len(written)
+    written.clear()
+    interruptions.extend((5, 15))
+    for _ in range(2):
+        with pytest.raises(_Interruption):
+            normalization.normalize(source, str(tmp_path / "resumed.wav"), checkpoint_interval=0.0, **settings)
+    interrupted = len(written)
+    normalization.normalize(source, str(tmp_path / "resumed.wav"), checkpoint_interval=0.0, **settings)
+    assert len(written) - interrupted < blocks  # the last run has continued after the checkpoint
+    with open(tmp_path / "reference.wav", "rb") as reference, open(tmp_path / "resumed.wav", "rb") as resumed:
+        assert resumed.read() == reference.read()